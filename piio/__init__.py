@@ -1,16 +1,72 @@
+import sys
+import types
+
 import _piio
 import _piio_digital
 import _piio_pwm
+import _piio_multi
+import _piio_shm
+import _piio_iothread
+import _piio_watchdog
+import _piio_record
+import _callscheduler
+import _piio_stream
+
+PiIoMulti = _piio_multi.PiIoMulti
+PiIoStatePublisher = _piio_shm.PiIoStatePublisher
+PiIoStateReader = _piio_shm.PiIoStateReader
+PiIoThread = _piio_iothread.PiIoThread
+PiIoWatchdog = _piio_watchdog.PiIoWatchdog
+PiIoRecorder = _piio_record.PiIoRecorder
+PiIoReplayer = _piio_record.PiIoReplayer
+DecodeBits = _piio_digital.DecodeBits
+CallScheduler = _callscheduler.CallScheduler
+PiIoStream = _piio_stream.PiIoStream
+PRIORITY_CRITICAL = _callscheduler.PRIORITY_CRITICAL
+PRIORITY_INTERACTIVE = _callscheduler.PRIORITY_INTERACTIVE
+PRIORITY_BULK = _callscheduler.PRIORITY_BULK
+
+class _LazyPiIoModule(types.ModuleType):
+    '''
+    Module object for the piio package that postpones all bus activity until first use.
+
+    The main 'piio' object is created on first access of 'piio.piio'. An IO Group is looked
+    up and connected to on first access of its name, and stored on the module afterwards,
+    so later lookups do not pass through here again. Names starting with an underscore never
+    touch the bus, so private names and submodules (e.g. 'from piio import _piio_top') resolve normally.
+    '''
+    def __init__(self, module):
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # keep the original module alive; python clears a module's globals when it is collected
+        self._module = module
+
+    def __getattr__(self, name):
+        # only called when the attribute has not been materialized yet
+        if name == 'piio':
+            self.piio = _piio.PiIo()
+            return self.piio
+        elif name == '__all__':
+            return self._names()
+        elif name.startswith('_'):
+            raise AttributeError(name)
 
-piio = _piio.PiIo()
+        g = self.piio.IoGroup(name)
+        if g is None:
+            raise AttributeError("No such IO Group: " + name)
+        setattr(self, name, g)
+        return g
 
-__all__ = ['piio']
+    def _names(self):
+        # the public classes and functions of the package, then the IO Groups
+        l = sorted(name for (name, value) in self._module.__dict__.items()
+                   if not name.startswith('_') and not isinstance(value, types.ModuleType))
+        l.append('piio')
+        for name in self.piio.IoGroupNames():
+            if name in self._module.__dict__:
+                print "piio error: Cannot register IO Group '{0}' because it conflicts with an existing python variable with the same name".format(name)
+            else:
+                l.append(name)
+        return l
 
-for _g in piio.IoGroups():
-    if not _g.Name in globals():
-        globals()[_g.Name] = _g
-        __all__.append(_g.Name)
-    else:
-        print "piio error: Cannot register IO Group '{0}' because it conflicts with an existing python variable with the same name".format(_g.Name)
-    
-   
\ No newline at end of file
+sys.modules[__name__] = _LazyPiIoModule(sys.modules[__name__])
@@ -0,0 +1,170 @@
+'''
+Client-side scheduling of non-blocking dbus calls by priority class.
+
+Every non-blocking call goes through a CallScheduler in one of three classes:
+
+    PRIORITY_CRITICAL       writes that must get through under load, e.g. from a control loop
+    PRIORITY_INTERACTIVE    reads and writes on behalf of a user or application logic
+    PRIORITY_BULK           background traffic, e.g. loggers polling many values
+
+Each class has a cap on the number of calls that are sent but not yet answered; calls beyond the cap wait
+in the client until an earlier call of the same class completes. Critical calls are not capped by default,
+so they are sent immediately, and at most the capped number of interactive and bulk calls can be queued
+ahead of them on the bus and in the server. That bounds their latency however much bulk traffic is submitted.
+'''
+
+import time
+import threading
+import collections
+
+from _latency import LatencyStats
+
+PRIORITY_CRITICAL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+PRIORITY_NAMES = ['critical', 'interactive', 'bulk']
+
+class CallClass(object):
+    '''
+    Accounting of one priority class
+
+    Attributes:
+        Name:           Name of the class
+        Limit:          Maximum number of outstanding calls, or None for no limit
+        Outstanding:    Number of calls sent and not yet answered
+        Queued:         Number of calls waiting to be sent
+        Sent:           Number of calls sent
+        Errors:         Number of calls that failed
+        Latency:        LatencyStats from submission to reply, including the time spent waiting
+        Wait:           LatencyStats of the time spent waiting in the client before sending
+    '''
+    def __init__(self,name,limit):
+        self.Name = name
+        self.Limit = limit
+        self.Outstanding = 0
+        self.Sent = 0
+        self.Errors = 0
+        self.Latency = LatencyStats()
+        self.Wait = LatencyStats()
+        self._queue = collections.deque()
+
+    @property
+    def Queued(self):
+        return len(self._queue)
+
+    def Dict(self):
+        return {'limit': self.Limit,
+                'outstanding': self.Outstanding,
+                'queued': self.Queued,
+                'sent': self.Sent,
+                'errors': self.Errors,
+                'latency': self.Latency.Dict(),
+                'wait': self.Wait.Dict()}
+
+class CallScheduler(object):
+    '''
+    Sends non-blocking dbus calls in priority order, with a cap on outstanding calls per priority class
+
+    Attributes:
+        Classes:    list of CallClass, indexed by priority
+
+    The accounting is protected by a lock, as blocking calls record their latency from whatever thread
+    makes them (e.g. the worker threads of PiIoNode). Calls are sent outside the lock.
+    '''
+    def __init__(self,limits=(None, 16, 4)):
+        '''
+        'limits' holds the maximum number of outstanding calls for the critical, interactive and bulk classes;
+        None means no limit
+        '''
+        self.Classes = [CallClass(name, limit) for (name, limit) in zip(PRIORITY_NAMES, limits)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def Default(cls):
+        '''
+        Get the scheduler that is shared by all piio objects
+        '''
+        return _default
+
+    def SetLimit(self,priority,limit):
+        '''
+        Change the maximum number of outstanding calls of a priority class
+        '''
+        with self._lock:
+            self.Classes[priority].Limit = limit
+        self._pump(self.Classes[priority])
+
+    def Submit(self,priority,send,reply_handler,error_handler):
+        '''
+        Schedule a call. send(reply_handler, error_handler) starts the non-blocking call;
+        it is called immediately when the class is below its limit, otherwise once an earlier call completes.
+        '''
+        cls = self.Classes[priority]
+        with self._lock:
+            cls._queue.append((send, reply_handler, error_handler, time.time()))
+        self._pump(cls)
+
+    def Record(self,priority,latency):
+        '''
+        Record the latency of a blocking call in the accounting of a priority class
+        '''
+        with self._lock:
+            self.Classes[priority].Latency.Record(latency)
+
+    def Report(self):
+        '''
+        Get the accounting of all classes as a dict
+        '''
+        with self._lock:
+            return dict((cls.Name, cls.Dict()) for cls in self.Classes)
+
+    def _take(self,cls):
+        # with the lock held: take the queued calls that may be sent now
+        ready = []
+        while cls._queue and (cls.Limit is None or cls.Outstanding < cls.Limit):
+            (send, reply_handler, error_handler, t) = cls._queue.popleft()
+            cls.Wait.Record(time.time() - t)
+            cls.Outstanding += 1
+            cls.Sent += 1
+            ready.append((send, reply_handler, error_handler, t))
+        return ready
+
+    def _pump(self,cls):
+        while True:
+            with self._lock:
+                ready = self._take(cls)
+            if not ready:
+                return
+            for (send, reply_handler, error_handler, t) in ready:
+                try:
+                    send(self._replied(cls, t, reply_handler), self._failed(cls, t, error_handler))
+                except Exception as x:
+                    # e.g. the connection went away while the call was waiting; its place is free again
+                    with self._lock:
+                        cls.Outstanding -= 1
+                        cls.Errors += 1
+                    error_handler(x)
+
+    def _replied(self,cls,t,reply_handler):
+        def reply(*args):
+            self._complete(cls, t)
+            reply_handler(*args)
+        return reply
+
+    def _failed(self,cls,t,error_handler):
+        def error(e):
+            self._complete(cls, t, failed=True)
+            error_handler(e)
+        return error
+
+    def _complete(self,cls,t,failed=False):
+        with self._lock:
+            cls.Outstanding -= 1
+            if failed:
+                cls.Errors += 1
+            cls.Latency.Record(time.time() - t)
+        self._pump(cls)
+
+# created at import, so threads never race to create it
+_default = CallScheduler()
@@ -1,18 +1,56 @@
+import time
+import thread
 import dbus
+import dbus.bus
 import dbus.service
 import dbus.mainloop.glib
 import _event
+from _callscheduler import CallScheduler, PRIORITY_CRITICAL, PRIORITY_INTERACTIVE
 
 class NoConnectionError(Exception):
     pass
 
+def _ignore_reply(*args):
+    pass
+
+# error the server sends when the arguments of a call do not match the signature of the method
+_INVALID_ARGS = 'org.freedesktop.DBus.Error.InvalidArgs'
+
+# connections to explicit bus addresses, shared by all objects on the same address
+_address_connections = {}
+
+def _address_connection(address):
+    ''' Get the shared connection to the bus at the specified address, opening it if needed
+    '''
+    if not _address_connections.has_key(address):
+        conn = dbus.bus.BusConnection(address)
+        conn.call_on_disconnection(lambda c, address=address: _address_connections.pop(address, None))
+        _address_connections[address] = conn
+    return _address_connections[address]
+
+def _default_priority(method):
+    # writes are what a control loop depends on; everything else is interactive unless stated otherwise
+    if method.startswith("Set"):
+        return PRIORITY_CRITICAL
+    return PRIORITY_INTERACTIVE
+
 class DBusSmartObject:
-    def __init__(self,service,path,interface,systembus=False, silent=False):
+    def __init__(self,service,path,interface,systembus=False, silent=False, address=None, signatures=None):
+        ''' When 'address' is specified, the object connects to the bus at that D-Bus address
+            (e.g. 'tcp:host=pi2,port=7272' or 'unix:path=/tmp/piio-test') instead of the system or session bus
+            When 'signatures' is specified, as a dict of interface to a dict of method name to input signature,
+            the object is not introspected and arguments are marshalled using these signatures. When the server
+            rejects the arguments of such a call, the object falls back to introspection and retries the call.
+        '''
         # store service name and object path
         self._service = service
         self._object_path = path
         self._interface = interface
         self._silent = silent
+        self._address = address
+        self._signatures = signatures
+        # the thread that creates the object is the one that runs the main loop delivering its signals
+        self._ownerthread = thread.get_ident()
         
         if systembus == True:
             self._bus_type = dbus.Bus.TYPE_SYSTEM
@@ -28,7 +66,12 @@ class DBusSmartObject:
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 
         # connect to the dbus object to get information about existing connections
-        self._dbus = dbus.Bus(dbus.Bus.TYPE_SYSTEM)
+        if address is not None:
+            self._dbus = _address_connection(address)
+            # a remote bus can go away as a whole, without NameOwnerChanged being sent
+            self._dbus.call_on_disconnection(self._onDisconnected)
+        else:
+            self._dbus = dbus.Bus(dbus.Bus.TYPE_SYSTEM)
         self._dbus_object = self._dbus.get_object('org.freedesktop.DBus', '/org/freedesktop/DBus')
 
         # contains interface name of dbus interface
@@ -75,8 +118,11 @@ class DBusSmartObject:
             if not self._silent:
                 print "Initializing new connection to {0}:{1}".format(self._service,self._object_path)
 
-            self._bus = dbus.Bus(self._bus_type)
-            self._busobject = self._bus.get_object(self._service, self._object_path)
+            if self._address is not None:
+                self._bus = self._dbus
+            else:
+                self._bus = dbus.Bus(self._bus_type)
+            self._busobject = self._bus.get_object(self._service, self._object_path, introspect=(self._signatures is None))
             self._init_busobject(self._busobject)
             self._on_connection_made()
 
@@ -102,6 +148,11 @@ class DBusSmartObject:
             self._busobject = None
             self._on_connection_lost()
 
+    def _onDisconnected(self,connection):
+        ''' Detects loss of the connection to a bus at an explicit address
+        '''
+        self._close_existing_connection()
+
     def _onNameOwnerChanged(self,name,old_adr,new_adr):
         ''' Detects changes in service availablility
         '''
@@ -113,27 +164,101 @@ class DBusSmartObject:
             else:   # service changed address
                 self._initialize_new_connection()
             
+    def _signature(self, interface, method):
+        ''' Get the known input signature of a method, or None
+        '''
+        if self._signatures is None:
+            return None
+        return self._signatures.get(interface, {}).get(method)
+
+    def _signatureRejected(self, error, interface, method, signature):
+        ''' Check if 'error' means the server rejected a call marshalled with a bundled signature.
+            If so, stop using the bundled signatures for this object and introspect it instead, so the call can be retried
+        '''
+        if signature is None or not isinstance(error, dbus.DBusException) or error.get_dbus_name() != _INVALID_ARGS:
+            return False
+        if self._signatures is not None:
+            if not self._silent:
+                print "Server rejected signature '{0}' of {1}.{2} on {3}; falling back to introspection".format(signature,interface,method,self._object_path)
+            self._signatures = None
+            if self._busobject is not None:
+                # signal handlers are registered on the connection, so they stay with the new proxy
+                self._busobject = self._bus.get_object(self._service, self._object_path, introspect=True)
+        return self._busobject is not None
+
     def _call(self, method, *args, **kwargs):
         ''' Call a function on the registred dbus object
             When 'interface' is specified as a keyword argument, that interface is used for the call,
             otherwise the default interface for this object is used.
+            The call blocks, so it is not queued; its latency is recorded in the accounting of the
+            priority class given by the 'priority' keyword argument (see _asynccall).
             Throws NoConnectionError when a dbus connection to the object is currently not available
         '''
         if kwargs.has_key("interface"):
             interface = kwargs["interface"]
         else:
             interface = self._interface
+        priority = kwargs.get("priority", _default_priority(method))
             
         if self._busobject is not None:
             #print "Attempting to call {0}".format(method)
-            method = self._busobject.get_dbus_method(method,dbus_interface=interface)
+            name = method
+            signature = self._signature(interface, name)
+            method = self._busobject.get_dbus_method(name,dbus_interface=interface)
 
             #print "Got method - calling with arguments: {0}".format(args)
-            return method(*args)
+            t = time.time()
+            try:
+                if signature is not None:
+                    try:
+                        return method(*args, signature=signature)
+                    except dbus.DBusException as x:
+                        if not self._signatureRejected(x, interface, name, signature):
+                            raise
+                        return self._busobject.get_dbus_method(name,dbus_interface=interface)(*args)
+                return method(*args)
+            finally:
+                CallScheduler.Default().Record(priority, time.time() - t)
         else:
             raise NoConnectionError("Currently no connection to service {0}:{1}".format(self._service,self._object_path))
             
 
+    def _asynccall(self, method, *args, **kwargs):
+        ''' Call a function on the registred dbus object without waiting for the reply
+            When 'interface' is specified as a keyword argument, that interface is used for the call,
+            otherwise the default interface for this object is used.
+            'reply_handler' and 'error_handler' keyword arguments are called from the main loop when the
+            reply or error comes in. When they are not specified, the reply is ignored.
+            The call is sent through the shared CallScheduler in the class given by the 'priority' keyword
+            argument; by default Set* methods are critical and all other methods interactive.
+            Throws NoConnectionError when a dbus connection to the object is currently not available
+        '''
+        interface = kwargs.get("interface", self._interface)
+        reply_handler = kwargs.get("reply_handler", _ignore_reply)
+        error_handler = kwargs.get("error_handler", _ignore_reply)
+        priority = kwargs.get("priority", _default_priority(method))
+
+        if self._busobject is not None:
+            name = method
+            signature = self._signature(interface, name)
+            method = self._busobject.get_dbus_method(name,dbus_interface=interface)
+            def send(reply_handler, error_handler):
+                if signature is not None:
+                    def error(e):
+                        if not self._signatureRejected(e, interface, name, signature):
+                            error_handler(e)
+                            return
+                        try:
+                            self._busobject.get_dbus_method(name,dbus_interface=interface)(*args, reply_handler=reply_handler, error_handler=error_handler)
+                        except Exception as x:
+                            error_handler(x)
+                    method(*args, reply_handler=reply_handler, error_handler=error, signature=signature)
+                else:
+                    method(*args, reply_handler=reply_handler, error_handler=error_handler)
+            CallScheduler.Default().Submit(priority, send, reply_handler, error_handler)
+        else:
+            raise NoConnectionError("Currently no connection to service {0}:{1}".format(self._service,self._object_path))
+
     def _trycall(self,method, *args, **kwargs):
         ''' Call a function on the registred dbus object
             When 'interface' is specified as a keyword argument, that interface is used for the call,
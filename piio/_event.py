@@ -9,6 +9,8 @@ Provides generic event object that allows callback registration to events.
 
 '''
 
+import time
+
 class Event(object):
     '''
     Generic event object providing callback registration.
@@ -32,9 +34,15 @@ class Event(object):
         >>> event -= listener;
         >>> event("x");
 
+    An optional name identifies the event in profiling output.
     '''
-    def __init__(self):
+
+    # opt-in profiler that is told about every listener invocation; see PiIoWatchdog
+    _profiler = None
+
+    def __init__(self, name=None):
         self.listeners = [];
+        self.name = name;
     def __iadd__(self, listener):
         """
         Add new event listener.
@@ -62,5 +70,15 @@ class Event(object):
         Fire event, passing the specified arguments to all listeners.
         Each listener will be called with listener(*args, **kwargs).
         """
-        for listener in list(self.listeners):
-            listener(*args, **kwargs);
+        profiler = Event._profiler;
+        if profiler is None:
+            for listener in list(self.listeners):
+                listener(*args, **kwargs);
+        else:
+            for listener in list(self.listeners):
+                profiler._enter(self, listener, args);
+                t = time.time();
+                try:
+                    listener(*args, **kwargs);
+                finally:
+                    profiler._leave(time.time() - t);
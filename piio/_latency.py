@@ -0,0 +1,58 @@
+import math
+
+class LatencyStats(object):
+    '''
+    Running latency statistics
+
+    Attributes:
+        Count:   Number of recorded samples
+        Min:     Lowest recorded latency in seconds, or None
+        Max:     Highest recorded latency in seconds, or None
+        Mean:    Mean latency in seconds, or None
+        Jitter:  Standard deviation of the latency in seconds, or None
+    '''
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        '''
+        Forget all recorded samples
+        '''
+        self.Count = 0
+        self.Min = None
+        self.Max = None
+        self.Mean = None
+        self._m2 = 0.0
+
+    def Record(self,latency):
+        '''
+        Record a latency sample in seconds
+        '''
+        self.Count += 1
+        if self.Count == 1:
+            self.Min = latency
+            self.Max = latency
+            self.Mean = latency
+            return
+
+        if latency < self.Min:
+            self.Min = latency
+        if latency > self.Max:
+            self.Max = latency
+
+        # welford's running variance
+        delta = latency - self.Mean
+        self.Mean += delta / self.Count
+        self._m2 += delta * (latency - self.Mean)
+
+    @property
+    def Jitter(self):
+        if self.Count == 0:
+            return None
+        return math.sqrt(self._m2 / self.Count)
+
+    def Dict(self):
+        '''
+        Get the statistics as a dict
+        '''
+        return {'count': self.Count, 'min': self.Min, 'max': self.Max, 'mean': self.Mean, 'jitter': self.Jitter}
@@ -1,3 +1,4 @@
+import thread
 import gobject
 import dbus
 import dbus.service
@@ -5,6 +6,9 @@ import dbus.mainloop.glib
 
 from _event import Event
 from _dbus_smartobject import DBusSmartObject,NoConnectionError
+from _piio_binding import Binding, _compile, _booleansignals
+from _piio_stream import PiIoStream, GROUPEVENTS, _matcher
+import _piio_schema
 
 class PiIoDict(dict):
     def __getattr__(self, name):
@@ -22,6 +26,22 @@ class PiIoDict(dict):
         else:
             raise AttributeError("No such attribute: " + name)
 
+class Subscription(object):
+    '''
+    A listener registered on a PiIo object for a root signal of all IO matching a long handle pattern
+
+    Attributes:
+        Pattern:    The long handle pattern; may contain shell style wildcards (e.g. 'panel*.led*')
+        Signal:     The root event this subscription is for (e.g. 'OnInputChanged')
+        Listener:   The callable, called with the same arguments as the root event
+    '''
+    def __init__(self,pattern,signal,listener):
+        self.Pattern = pattern
+        self.Signal = signal
+        self.Listener = listener
+
+        self.Match = _matcher(pattern)
+
 class PiIo(DBusSmartObject):
     '''
     The main access point for the PIIO system
@@ -33,10 +53,21 @@ class PiIo(DBusSmartObject):
         OnMbInputChanged:  Event(handle, value) - an event triggers when a multibit input's value changed
     
     Note that the handle provided on these events is the long handle form consisting of [iogroup].[handlename] 
+
+    IO Groups obtained through this object are cached, and their IO is indexed by long handle (see Find).
+    Listeners for a subset of the IO can be registered once at the root with Subscribe.
+    When created with rootdispatch=True, the IO Groups do not subscribe to their own button and input
+    signals; the root signals are routed through the index to the IO Groups and IO objects instead.
     '''
 
     _classmap = {}
 
+    # root signal => the IO Group handler that processes it
+    _grouphandlers = {  'OnButtonPress':    '_buttonPress',
+                        'OnButtonHold':     '_buttonHold',
+                        'OnInputChanged':   '_inputChanged',
+                        'OnMbInputChanged': '_mbInputChanged' }
+
     @classmethod
     def RegisterClass(cls, interface, class_):
         cls._classmap[interface] = class_
@@ -45,21 +76,40 @@ class PiIo(DBusSmartObject):
     def FindClass(cls, interface):
         return cls._classmap[interface];
 
-    def __init__(self):
+    def __init__(self,address=None,rootdispatch=False,silent=False):
         '''
         Initialize an object that links to the main piio object
+        When 'address' is specified, the piio server on the bus at that D-Bus address is used instead of the system bus
+        When 'rootdispatch' is True, button and input signals reach the IO Groups through the root signals
+        When 'silent' is True, this object and its IO Groups print no connection messages
         '''
         # initialize the event
-        self.OnButtonPress = Event()
-        self.OnButtonHold = Event()
-        self.OnInputChanged = Event()
-        self.OnMbInputChanged = Event()
+        self.OnButtonPress = Event("OnButtonPress")
+        self.OnButtonHold = Event("OnButtonHold")
+        self.OnInputChanged = Event("OnInputChanged")
+        self.OnMbInputChanged = Event("OnMbInputChanged")
+
+        # cache of group path => (name, interface), filled on demand
+        self._groupinfo = {}
+
+        self._rootdispatch = rootdispatch
+        # group path => IO Group object, and the same by group name
+        self._groups = {}
+        self._groupsbyname = {}
+        # long handle => (IO Group object, short handle)
+        self._index = {}
+        # root signal => list of subscriptions, and root signal => long handle => tuple of matching listeners
+        self._subscriptions = {}
+        self._routes = {}
 
         DBusSmartObject.__init__(   self, 
                                     service='nl.miqra.PiIo', 
                                     path='/nl/miqra/PiIo',
                                     interface='nl.miqra.PiIo', 
-                                    systembus=True)       
+                                    systembus=True,
+                                    silent=silent,
+                                    address=address,
+                                    signatures=_piio_schema.SIGNATURES)       
 
     def _init_busobject(self,busobject):
 
@@ -75,45 +125,227 @@ class PiIo(DBusSmartObject):
         # connect_to_signal registers our callback function.
         busobject.connect_to_signal('OnMbInputChanged', self._onMbInputChanged)
 
+    def _on_connection_lost(self):
+        # group layout may be different when the server comes back
+        self._groupinfo = {}
+
+    def _on_connection_regained(self):
+        self._groupinfo = {}
+
     #callback functions for global input events
 
     def _onButtonPress(self,longhandle):
         """
         gets called when a button is pressed
         """
+        self._route('OnButtonPress', longhandle, (longhandle,))
         self.OnButtonPress(longhandle)
 
     def _onButtonHold(self,longhandle):
         """
         gets called when a button is held
         """
+        self._route('OnButtonHold', longhandle, (longhandle,))
         self.OnButtonHold(longhandle)
 
     def _onInputChanged(self,longhandle,value):
         """
         gets called when a single input pin changes value
         """
+        self._route('OnInputChanged', longhandle, (longhandle, value))
         self.OnInputChanged(longhandle,value)
 
     def _onMbInputChanged(self,longhandle,value):
         """
         gets called when a multibit input changes value
         """
+        self._route('OnMbInputChanged', longhandle, (longhandle, value))
         self.OnMbInputChanged(longhandle,value)        
 
+    def _route(self,signal,longhandle,args):
+        '''
+        Pass a root signal on to the IO Group it belongs to (in rootdispatch mode) and to the matching subscriptions
+        '''
+        if self._rootdispatch:
+            entry = self._lookup(longhandle)
+            if entry is not None:
+                (group, handle) = entry
+                getattr(group, PiIo._grouphandlers[signal])(handle, *args[1:])
+
+        if self._subscriptions.has_key(signal):
+            routes = self._routes.setdefault(signal, {})
+            listeners = routes.get(longhandle)
+            if listeners is None:
+                listeners = tuple(sub.Listener for sub in self._subscriptions[signal] if sub.Match(longhandle))
+                routes[longhandle] = listeners
+            for listener in listeners:
+                listener(*args)
+
+    def _lookup(self,longhandle):
+        '''
+        Get the (IO Group, short handle) tuple for a long handle, or None.
+        Only IO Groups that were obtained through this object are considered.
+        '''
+        entry = self._index.get(longhandle)
+        if entry is None:
+            # handle may have appeared after the group was indexed
+            (groupname, sep, handle) = longhandle.partition('.')
+            group = self._groupsbyname.get(groupname)
+            if group is not None and group.Find(handle) is not None:
+                entry = (group, str(handle))
+                self._index[str(longhandle)] = entry
+        return entry
+
+    def _addGroup(self,path,name,interface):
+        '''
+        Get the cached IO Group object for a path, creating and indexing it if needed
+        '''
+        if not self._groups.has_key(path):
+            g = self.__class__.FindClass(interface)(path,silent=self._silent,address=self._address,rootdispatch=self._rootdispatch)
+            self._groups[path] = g
+            self._groupsbyname[name] = g
+            for dictname in g._handledicts:
+                for handle in getattr(g, dictname).keys():
+                    self._index[name + "." + handle] = (g, handle)
+        return self._groups[path]
+
+    def _groupInfo(self,path):
+        """
+        Get the (name, interface) tuple of the IO Group at the specified path.
+        Uses a bare proxy on the existing connection instead of a full PiIoGroup object,
+        and caches the result until the connection is lost.
+        Throws NoConnectionError when a dbus connection is currently not available
+        """
+        path = str(path)
+        if not self._groupinfo.has_key(path):
+            if self._bus is None:
+                raise NoConnectionError("Currently no connection to service {0}:{1}".format(self._service,self._object_path))
+            o = self._bus.get_object(self._service, path, introspect=False)
+            name = str(o.Name(dbus_interface='nl.miqra.PiIo.IoGroup'))
+            interface = str(o.Interface(dbus_interface='nl.miqra.PiIo.IoGroup'))
+            self._groupinfo[path] = (name, interface)
+        return self._groupinfo[path]
+
     # public methods
+    def VerifySchema(self):
+        '''
+        Check the bundled interface schema against the introspection data of the live server,
+        for the main object and all IO Groups.
+        Returns a list of descriptions of the differences; empty when everything matches
+        '''
+        problems = []
+        for path in [self._object_path] + self.IoGroupPaths():
+            try:
+                if self._bus is None:
+                    raise NoConnectionError("Currently no connection to service {0}:{1}".format(self._service,self._object_path))
+                o = self._bus.get_object(self._service, path, introspect=False)
+                xml = o.Introspect(dbus_interface='org.freedesktop.DBus.Introspectable')
+            except NoConnectionError as x:
+                problems.append("{0}: {1}".format(path, x))
+                continue
+            problems.extend(_piio_schema.VerifySchema(xml, path))
+        return problems
+
+    def Find(self,longhandle):
+        '''
+        Get the IO object for the specified long handle of the form [iogroup].[handlename], or None if it does not exist.
+        The IO Group is connected to when it was not used before.
+        '''
+        (groupname, sep, handle) = longhandle.partition('.')
+        if not self._groupsbyname.has_key(groupname) and self.IoGroup(groupname) is None:
+            return None
+        entry = self._lookup(longhandle)
+        if entry is None:
+            return None
+        return entry[0].Find(entry[1])
+
+    def Subscribe(self,pattern,signal,listener):
+        '''
+        Register 'listener' for root event 'signal' (e.g. 'OnInputChanged') of all IO whose long handle
+        matches 'pattern'. The pattern may contain shell style wildcards, e.g. 'panel*.led*'.
+        The listener is called with the same arguments as the root event.
+        Returns a Subscription object
+        '''
+        if not PiIo._grouphandlers.has_key(signal):
+            raise ValueError("No such root event: " + str(signal))
+        sub = Subscription(pattern, signal, listener)
+        self._subscriptions.setdefault(signal, []).append(sub)
+        self._routes.pop(signal, None)
+        return sub
+
+    def Unsubscribe(self,subscription):
+        '''
+        Remove a subscription created with Subscribe
+        '''
+        subs = self._subscriptions.get(subscription.Signal, [])
+        if subscription not in subs:
+            raise ValueError("Subscription not registered")
+        subs.remove(subscription)
+        if not subs:
+            del self._subscriptions[subscription.Signal]
+        self._routes.pop(subscription.Signal, None)
+
+    def Stream(self,pattern='*',maxsize=10000,coalesce=False):
+        '''
+        Get a PiIoStream of the root events (button, input and multibit input changes) of all IO whose
+        long handle matches 'pattern'. See PiIoStream for 'maxsize' and 'coalesce'.
+        The stream keeps gathering records until it is closed.
+        Call from the thread that runs the main loop; with a PiIoThread, use PiIoThread.Stream.
+        '''
+        if thread.get_ident() != self._ownerthread:
+            raise RuntimeError("Stream must be called from the thread that runs the main loop of this object")
+        stream = PiIoStream(maxsize, coalesce)
+        for signal in PiIo._grouphandlers.keys():
+            # record kinds are named after the group events, e.g. 'InputChanged' for 'OnInputChanged'
+            sub = self.Subscribe(pattern, signal, stream._recorder(signal[2:]))
+            stream._onClose(lambda sub=sub: self.Unsubscribe(sub))
+        return stream
+
+    def IoGroupPaths(self):
+        '''
+        Get a list of the object paths of currently valid IO Groups
+        '''
+        return [str(path) for path in self._trycall("IoGroups",default=[])]
+
+    def IoGroupNames(self):
+        '''
+        Get a list of the names of currently valid IO Groups, without connecting to the groups themselves
+        '''
+        l = []
+        for path in self.IoGroupPaths():
+            try:
+                l.append(self._groupInfo(path)[0])
+            except NoConnectionError as x:
+                break
+        return l
+
+    def IoGroup(self,name):
+        '''
+        Get the IO Group with the specified name, or None if no such group exists.
+        Only the requested group is connected to, and only the first time it is requested.
+        '''
+        if self._groupsbyname.has_key(name):
+            return self._groupsbyname[name]
+        for path in self.IoGroupPaths():
+            try:
+                (groupname, interface) = self._groupInfo(path)
+            except NoConnectionError as x:
+                return None
+            if groupname == name:
+                return self._addGroup(path, groupname, interface)
+        return None
+
     def IoGroups(self):
         '''
         Get a list of currently valid IO Groups
         '''
-        paths = self._trycall("IoGroups",default=[])
         l = []
-        for path in paths:
-            # first object is to determine interface of group
-            g = PiIoGroup(path,silent=True)
-            # second object is actual connection
-            o = self.__class__.FindClass(g.Interface)(path)
-            l.append(o)
+        for path in self.IoGroupPaths():
+            try:
+                (name, interface) = self._groupInfo(path)
+            except NoConnectionError as x:
+                break
+            l.append(self._addGroup(path, name, interface))
         return l
 
 PiIo.RegisterClass("nl.miqra.PiIo", PiIo)
@@ -122,22 +354,156 @@ class PiIoGroup(DBusSmartObject):
     '''
     Base class for IO Groups to inherit from
     '''
-    def __init__(self,path,silent=False):
+
+    # (handle dict, signal) pairs that can be used as binding source; override in child class
+    _bindsources = []
+    # handle dicts that can be used as binding target; override in child class
+    _bindtargets = []
+    # all handle dicts of the group; override in child class
+    _handledicts = []
+
+    def __init__(self,path,silent=False,address=None,rootdispatch=False):
         '''
         Initialize the base object for an IO Group connection
+        When 'rootdispatch' is True, signals that the main piio object also sends are delivered by it,
+        so the group does not subscribe to them itself
         '''
+        # signal => short handle => tuple of bindings
+        self._bindings = {}
+        self._rootdispatch = rootdispatch
+        # group name, fetched when the first IO is created
+        self._groupname = None
+
         DBusSmartObject.__init__(  self, 
                                                     service='nl.miqra.PiIo', 
                                                     path=path,
                                                     interface='nl.miqra.PiIo.IoGroup', 
                                                     systembus=True,
-                                                    silent=silent)      
+                                                    silent=silent,
+                                                    address=address,
+                                                    signatures=_piio_schema.SIGNATURES)      
 
     # initalization for group access. will be called on first connect and each reconnect
     # override in child class
     def _init_busobject(self,busobject):
         pass
         
+    def _longHandle(self,handle):
+        '''
+        Get the long handle of the IO with short handle 'handle' in this group
+        '''
+        if self._groupname is None:
+            name = self._trycall("Name", default=None)
+            if name is None:
+                return handle
+            self._groupname = str(name)
+        return self._groupname + "." + handle
+
+    def Find(self,handle):
+        '''
+        Get the IO object with the specified short handle, or None if it does not exist
+        '''
+        for dictname in self._handledicts:
+            d = getattr(self, dictname)
+            if d.has_key(handle):
+                return d[handle]
+        return None
+
+    def _fireBindings(self,signal,handle,value):
+        '''
+        Evaluate the bindings for a signal; called from the signal handlers of child classes
+        '''
+        if self._bindings:
+            table = self._bindings.get(signal)
+            if table is not None:
+                for b in table.get(handle, ()):
+                    b._fire(value)
+
+    def Bind(self,source,target,mapping=None,invert=False,mininterval=0.0):
+        '''
+        Bind the IO with short handle 'source' in this group to the 'target' IO, so that every change
+        of the source is written to the target directly from the signal handler.
+
+        'target' is an output IO object (possibly of another group), or the short handle of one in this group.
+        'mapping' is a dict of source value to target value, or a callable taking the source value;
+        when it gives None, the target is left alone. When 'invert' is True the source value is inverted
+        before mapping; this is only valid for boolean sources (buttons, inputs and outputs).
+        For multibit and pwm sources, use a mapping instead. Writes to the target are at least 'mininterval'
+        seconds apart; the last value always gets written. Buttons have the value True when pressed.
+
+        Returns a Binding object
+        '''
+        signal = None
+        for (dictname, signalname) in self._bindsources:
+            if getattr(self, dictname).has_key(source):
+                signal = signalname
+                break
+        if signal is None:
+            raise ValueError("No such source IO in group: " + str(source))
+        if invert and signal not in _booleansignals:
+            raise ValueError("Invert is only valid for boolean source IO, use a mapping for " + str(source))
+
+        if isinstance(target, basestring):
+            handle = target
+            target = None
+            for dictname in self._bindtargets:
+                if getattr(self, dictname).has_key(handle):
+                    target = getattr(self, dictname)[handle]
+                    break
+            if target is None:
+                raise ValueError("No such target IO in group: " + handle)
+        if not hasattr(target, '_setAsync'):
+            raise ValueError("Target IO can not be written: " + str(target))
+
+        b = Binding(self, signal, source, target, _compile(mapping, invert), mininterval)
+        table = self._bindings.setdefault(signal, {})
+        table[source] = table.get(source, ()) + (b,)
+        return b
+
+    def Unbind(self,binding):
+        '''
+        Remove a binding created with Bind
+        '''
+        table = self._bindings.get(binding.Signal, {})
+        bindings = table.get(binding.Source, ())
+        if binding not in bindings:
+            raise ValueError("Binding not registered to group")
+        binding._cancel()
+        bindings = tuple(b for b in bindings if b is not binding)
+        if bindings:
+            table[binding.Source] = bindings
+        else:
+            del table[binding.Source]
+            if not table:
+                del self._bindings[binding.Signal]
+
+    def Bindings(self):
+        '''
+        Get a list of all bindings of this group
+        '''
+        l = []
+        for table in self._bindings.values():
+            for bindings in table.values():
+                l.extend(bindings)
+        return l
+
+    def Stream(self,pattern='*',maxsize=10000,coalesce=False):
+        '''
+        Get a PiIoStream of all events of this group, for the IO whose long handle matches 'pattern'.
+        See PiIoStream for 'maxsize' and 'coalesce'. The stream keeps gathering records until it is closed.
+        Call from the thread that runs the main loop; with a PiIoThread, use PiIoThread.Stream.
+        '''
+        if thread.get_ident() != self._ownerthread:
+            raise RuntimeError("Stream must be called from the thread that runs the main loop of this object")
+        stream = PiIoStream(maxsize, coalesce)
+        match = None if pattern == '*' else _matcher(pattern)
+        prefix = self.Name + "."
+        for kind in GROUPEVENTS:
+            event = getattr(self, kind, None)
+            if isinstance(event, Event):
+                stream._listen(event, stream._recorder(kind, prefix, match))
+        return stream
+
     @property
     def Name(self):
         '''
@@ -0,0 +1,138 @@
+import time
+import gobject
+
+from _dbus_smartobject import NoConnectionError
+from _latency import LatencyStats
+
+# source signals with a boolean value, for which 'invert' is valid
+_booleansignals = ['ButtonPress', 'InputChanged', 'OutputChanged']
+
+class Binding(object):
+    '''
+    A direct link from a source handle of an IO Group to a target IO.
+
+    Bindings are evaluated straight from the signal handler of the source IO Group, before any Event
+    listeners run. The target is written without waiting for the reply. While a write is in flight,
+    or when the minimum interval since the last write has not passed yet, later values are coalesced
+    so that only the most recent one is written.
+
+    Attributes:
+        Source:     Short handle of the source IO
+        Signal:     Name of the IO Group signal the binding reacts to
+        Target:     Target IO object
+        Latency:    LatencyStats for the time between the source signal and the reply to the write
+        Fired:      Number of source changes seen
+        Sent:       Number of writes sent
+        Coalesced:  Number of values that were replaced by a later one before being written
+        Errors:     Number of failed writes or mapping errors
+    '''
+    def __init__(self,group,signal,source,target,func,mininterval):
+        self.Source = source
+        self.Signal = signal
+        self.Target = target
+        self.Latency = LatencyStats()
+        self.Fired = 0
+        self.Sent = 0
+        self.Coalesced = 0
+        self.Errors = 0
+
+        self._group = group
+        self._func = func
+        self._mininterval = mininterval
+        self._busy = False
+        self._next = 0.0
+        self._pending = None
+        self._timer = None
+
+    def Unbind(self):
+        '''
+        Remove this binding from its IO Group
+        '''
+        self._group.Unbind(self)
+
+    def _fire(self,value):
+        t = time.time()
+        self.Fired += 1
+        try:
+            value = self._func(value)
+        except Exception as x:
+            self.Errors += 1
+            return
+        if value is None:
+            # mapping decided there is nothing to do
+            return
+
+        if self._busy or t < self._next:
+            if self._pending is not None:
+                self.Coalesced += 1
+            self._pending = (value, t)
+            self._schedule()
+        else:
+            self._send(value, t)
+
+    def _send(self,value,t):
+        self._busy = True
+        self._next = time.time() + self._mininterval
+        self.Sent += 1
+        try:
+            self.Target._setAsync(value,
+                                  reply_handler=lambda *args: self._onReply(t),
+                                  error_handler=lambda e: self._onError(e, t))
+        except NoConnectionError as x:
+            self._onError(x, t)
+
+    def _onReply(self,t):
+        self.Latency.Record(time.time() - t)
+        self._busy = False
+        self._schedule()
+
+    def _onError(self,error,t):
+        self.Errors += 1
+        self._busy = False
+        self._schedule()
+
+    def _schedule(self):
+        ''' Send the pending value now, or set a timer for when the rate limit allows it
+        '''
+        if self._pending is None or self._busy or self._timer is not None:
+            return
+        delay = self._next - time.time()
+        if delay <= 0:
+            (value, t) = self._pending
+            self._pending = None
+            self._send(value, t)
+        else:
+            self._timer = gobject.timeout_add(int(delay * 1000) + 1, self._onTimer)
+
+    def _onTimer(self):
+        self._timer = None
+        self._schedule()
+        return False
+
+    def _cancel(self):
+        self._pending = None
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+
+
+def _compile(mapping,invert):
+    '''
+    Build the function that turns a source value into a target value
+    'mapping' is either None, a dict of source value to target value, or a callable
+    '''
+    if mapping is None:
+        f = None
+    elif callable(mapping):
+        f = mapping
+    else:
+        f = mapping.get
+
+    if f is None and not invert:
+        return lambda value: value
+    elif f is None:
+        return lambda value: not value
+    elif not invert:
+        return f
+    else:
+        return lambda value: f(not value)
@@ -1,3 +1,5 @@
+import math
+import time
 import gobject
 import dbus
 import dbus.service
@@ -25,7 +27,17 @@ class PiIoGroupDigital (PiIoGroup):
     Note that the handle provided on these events is the short handle relative to this IO Group.
         
     '''
-    def __init__(self,path):
+
+    _bindsources = [('buttons', 'ButtonPress'),
+                    ('inputs', 'InputChanged'),
+                    ('outputs', 'OutputChanged'),
+                    ('mbinputs', 'MbInputChanged'),
+                    ('mboutputs', 'MbOutputChanged'),
+                    ('pwms', 'PwmValueChanged')]
+    _bindtargets = ['outputs', 'mboutputs', 'pwms']
+    _handledicts = ['buttons', 'inputs', 'outputs', 'mbinputs', 'mboutputs', 'pwms']
+
+    def __init__(self,path,silent=False,address=None,rootdispatch=False):
         '''
         Initialize the object for a Digital IO Group connection
         '''
@@ -33,13 +45,13 @@ class PiIoGroupDigital (PiIoGroup):
         self._dbus_itf_iogroup_digital='nl.miqra.PiIo.IoGroup.Digital'
 
         # declare events
-        self.ButtonPress     = Event() # arguments: handle
-        self.ButtonHold      = Event() # arguments: handle
-        self.InputChanged    = Event() # arguments: handle, value
-        self.OutputChanged   = Event() # arguments: handle, value
-        self.MbInputChanged  = Event() # arguments: handle, value
-        self.MbOutputChanged = Event() # arguments: handle, value
-        self.PwmValueChanged = Event() # arguments: handle, value
+        self.ButtonPress     = Event("ButtonPress") # arguments: handle
+        self.ButtonHold      = Event("ButtonHold") # arguments: handle
+        self.InputChanged    = Event("InputChanged") # arguments: handle, value
+        self.OutputChanged   = Event("OutputChanged") # arguments: handle, value
+        self.MbInputChanged  = Event("MbInputChanged") # arguments: handle, value
+        self.MbOutputChanged = Event("MbOutputChanged") # arguments: handle, value
+        self.PwmValueChanged = Event("PwmValueChanged") # arguments: handle, value
 
         self.buttons = PiIoDict()
         self.inputs = PiIoDict()
@@ -49,17 +61,19 @@ class PiIoGroupDigital (PiIoGroup):
         self.pwms = PiIoDict()
 
 
-        PiIoGroup.__init__(self,path)
+        PiIoGroup.__init__(self,path,silent=silent,address=address,rootdispatch=rootdispatch)
 
     def _init_busobject(self,busobject):
         PiIoGroup._init_busobject(self,busobject)
         
         # connect_to_signal registers our callback function.
-        busobject.connect_to_signal('ButtonPress', self._buttonPress)
-        busobject.connect_to_signal('ButtonHold', self._buttonHold)
-        busobject.connect_to_signal('InputChanged', self._inputChanged)
+        # button and input signals are also sent by the main piio object, which can deliver them instead
+        if not self._rootdispatch:
+            busobject.connect_to_signal('ButtonPress', self._buttonPress)
+            busobject.connect_to_signal('ButtonHold', self._buttonHold)
+            busobject.connect_to_signal('InputChanged', self._inputChanged)
+            busobject.connect_to_signal('MbInputChanged', self._mbInputChanged)
         busobject.connect_to_signal('OutputChanged', self._outputChanged)
-        busobject.connect_to_signal('MbInputChanged', self._mbInputChanged)
         busobject.connect_to_signal('MbOutputChanged', self._mbOutputChanged)
         busobject.connect_to_signal('PwmValueChanged', self._pwmValueChanged)
 
@@ -110,10 +124,24 @@ class PiIoGroupDigital (PiIoGroup):
 
         except NoConnectionError as x:
             print "Error: Lost connection to piio-server during initialization"
+
+    def _on_connection_lost(self):
+        self._forgetValues()
+
+    def _on_connection_regained(self):
+        # the server may have restarted with different values
+        self._forgetValues()
+
+    def _forgetValues(self):
+        ''' Drop the cached values of the multibit IO
+        '''
+        for o in self.mbinputs.values() + self.mboutputs.values():
+            o._forget()
             
     def _buttonPress(self,handle):
         """ gets called when a button is pressed
         """
+        self._fireBindings("ButtonPress", handle, True)
         self.buttons[handle]._trigger("ButtonPress");
         self.ButtonPress(handle)
 
@@ -126,30 +154,35 @@ class PiIoGroupDigital (PiIoGroup):
     def _inputChanged(self,handle, value):
         """ gets called when a single input pin changes value
         """
+        self._fireBindings("InputChanged", handle, value)
         self.inputs[handle]._trigger("InputChanged");
         self.InputChanged(handle, value)
 
     def _outputChanged(self,handle, value):
         """ gets called when a single bit output has it's value changed
         """
+        self._fireBindings("OutputChanged", handle, value)
         self.outputs[handle]._trigger("OutputChanged");
         self.OutputChanged(handle, value)
 
     def _mbInputChanged(self,handle, value):
         """ gets called when a multibit input changes value
         """
-        self.mbinputs[handle]._trigger("MbInputChanged");
+        self._fireBindings("MbInputChanged", handle, value)
+        self.mbinputs[handle]._trigger("MbInputChanged", value);
         self.MbInputChanged(handle, value)
 
     def _mbOutputChanged(self,handle, value):
         """ gets called when a multibit output has it's value changed
         """
-        self.mboutputs[handle]._trigger("MbOutputChanged");
+        self._fireBindings("MbOutputChanged", handle, value)
+        self.mboutputs[handle]._trigger("MbOutputChanged", value);
         self.MbOutputChanged(handle, value)
 
     def _pwmValueChanged(self,handle, value):
         """ gets called when a pwm pin has it's value changed
         """
+        self._fireBindings("PwmValueChanged", handle, value)
         self.pwms[handle]._trigger("PwmValueChanged");
         self.PwmValueChanged(handle, value)
 
@@ -182,6 +215,8 @@ class DigitalIoBase(object):
     def __init__(self,iogroup,handle):
         self._iogroup = iogroup
         self._handle = handle
+        # events of the IO are named after the long handle, so profiling tells which group fired
+        self._longhandle = iogroup._longHandle(handle)
 
     def Name(self):
         '''
@@ -237,6 +272,11 @@ class DigitalIoBase(object):
 #        print "Return value of {0} is {1}".format(method,val)
         return val
 
+    # call a function on the IO Group without waiting for the reply
+    def _asynccall(self, method, *args, **kwargs):
+        kwargs['interface'] = self._iogroup._dbus_itf_iogroup_digital
+        return self._iogroup._asynccall(method, *args, **kwargs)
+
     # override this internal setter in child class
     def _set(self,value):
         raise NotImplementedError, "Value assignment not valid for this type of io"
@@ -245,6 +285,39 @@ class DigitalIoBase(object):
     def _get(self,default=None):
         raise NotImplementedError, "Value retrieval not valid for this type of io"
 
+    # override this internal non-blocking getter in child class
+    def _getAsync(self, **kwargs):
+        raise NotImplementedError, "Value retrieval not valid for this type of io"
+
+    # timed writes through the shared scheduler; only valid for IO that define _setAsync
+    def Pulse(self,ms,value=True,restore=False):
+        '''
+        Set this IO to 'value' now and back to 'restore' after 'ms' milliseconds.
+        Replaces any pending timed action on this IO.
+        '''
+        return Scheduler().Pulse(self, ms, value, restore)
+
+    def SetAt(self,when,value):
+        '''
+        Set this IO to 'value' at time 'when' (as returned by time.time()).
+        Replaces any pending timed action on this IO.
+        '''
+        return Scheduler().SetAt(self, when, value)
+
+    def Pattern(self,steps,repeat=False):
+        '''
+        Run a pattern of (value, ms) steps on this IO, starting now; each value is held for its number of
+        milliseconds. When 'repeat' is True, the pattern loops until cancelled.
+        Replaces any pending timed action on this IO.
+        '''
+        return Scheduler().Pattern(self, steps, repeat)
+
+    def CancelTimed(self):
+        '''
+        Cancel any pending timed action on this IO
+        '''
+        Scheduler().Cancel(self)
+
     # override this internal trigger function to respond to events
     def _trigger(self,eventname,value=None):
         raise NotImplementedError, "Event triggering of event '{0}' with value '{1}' not valid for this io type".format(eventname,value)
@@ -260,12 +333,15 @@ class DigitalButton(DigitalIoBase):
     def __init__(self, iogroup, handle):
         DigitalIoBase.__init__(self,iogroup, handle)
 
-        self.OnPress = Event();
-        self.OnHold = Event();
+        self.OnPress = Event(self._longhandle + ".OnPress");
+        self.OnHold = Event(self._longhandle + ".OnHold");
 
     def _get(self,default=None):
         print "Test",self._handle
         return self._call("GetButton",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetButton",self._handle,**kwargs)
     
     def _trigger(self,eventname, value=None):
         if value is None and eventname == "ButtonPress":
@@ -286,10 +362,13 @@ class DigitalInput(DigitalIoBase):
     def __init__(self, iogroup, handle):
         DigitalIoBase.__init__(self,iogroup, handle)
 
-        self.OnChanged = Event();
+        self.OnChanged = Event(self._longhandle + ".OnChanged");
 
     def _get(self,default=None):
         return self._trycall("GetInput",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetInput",self._handle,**kwargs)
     
     def _trigger(self,eventname, value=None):
         if eventname == "InputChanged":
@@ -309,13 +388,19 @@ class DigitalOutput(DigitalIoBase):
     def __init__(self, iogroup, handle):
         DigitalIoBase.__init__(self,iogroup, handle)
 
-        self.OnChanged = Event();
+        self.OnChanged = Event(self._longhandle + ".OnChanged");
 
     def _get(self,default=None):
         return self._trycall("GetOutput",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetOutput",self._handle,**kwargs)
         
     def _set(self, value):
         return self._trycall("SetOutput",self._handle)
+
+    def _setAsync(self, value, **kwargs):
+        return self._asynccall("SetOutput",self._handle,value,**kwargs)
     
     def _trigger(self,eventname, value=None):
         if eventname == "OutputChanged":
@@ -323,7 +408,87 @@ class DigitalOutput(DigitalIoBase):
         else:
             DigitalIoBase._trigger(self,eventname,value)
             
-class DigitalMbInput(DigitalIoBase):
+class BitView(object):
+    '''
+    Bit level view on a multibit IO: view[3] is bit 3 of the value (bit 0 being the least significant bit).
+    On multibit outputs, assigning a bit does a masked write that leaves the other bits alone.
+    '''
+    def __init__(self,io):
+        self._io = io
+
+    def __getitem__(self,index):
+        return bool((self._io._current() >> index) & 1)
+
+    def __setitem__(self,index,value):
+        self._io.WriteMasked(1 << index, (1 << index) if value else 0)
+
+class FieldView(object):
+    '''
+    Named sub-field view on a multibit IO; fields are defined with DefineField on the IO
+    and accessed as attributes (view.name). On multibit outputs, assigning a field does a masked write
+    that leaves the other bits alone.
+    '''
+    def __init__(self,io):
+        object.__setattr__(self, '_io', io)
+        object.__setattr__(self, '_fields', {})
+
+    def __getattr__(self,name):
+        if not self._fields.has_key(name):
+            raise AttributeError("No such field: " + name)
+        (offset, width) = self._fields[name]
+        return (self._io._current() >> offset) & ((1 << width) - 1)
+
+    def __setattr__(self,name,value):
+        if not self._fields.has_key(name):
+            raise AttributeError("No such field: " + name)
+        (offset, width) = self._fields[name]
+        mask = ((1 << width) - 1) << offset
+        self._io.WriteMasked(mask, (int(value) << offset) & mask)
+
+class DigitalMbBase(DigitalIoBase):
+    '''
+    Common base for multibit IO, providing bit and field level views on the value
+
+    Attributes:
+        bits:       BitView on the value (io.bits[3])
+        fields:     FieldView on the value, for fields defined with DefineField (io.fields.name)
+
+    The last known value is cached from change signals and own writes, so reading through the views
+    normally does not need a call to the server.
+    '''
+    def __init__(self, iogroup, handle):
+        DigitalIoBase.__init__(self,iogroup, handle)
+        self._cached = None
+        self.bits = BitView(self)
+        self.fields = FieldView(self)
+
+    def DefineField(self,name,offset,width=1):
+        '''
+        Define a named field of 'width' bits starting at bit 'offset'
+        '''
+        self.fields._fields[name] = (offset, width)
+
+    def _current(self):
+        # last known value, asking the server only when nothing is known yet
+        if self._cached is None:
+            value = self._get()
+            if value is None:
+                raise NoConnectionError("Value of {0} is not known".format(self._handle))
+            self._cached = int(value)
+        return self._cached
+
+    def _cache(self,value):
+        if value is not None:
+            self._cached = int(value)
+
+    def _forget(self):
+        # the next read through the views asks the server again
+        self._cached = None
+
+    def WriteMasked(self,mask,bits):
+        raise NotImplementedError, "Value assignment not valid for this type of io"
+
+class DigitalMbInput(DigitalMbBase):
     '''
     Handler class for Multibit Inputs
 
@@ -331,39 +496,110 @@ class DigitalMbInput(DigitalIoBase):
         OnChanged:     Event(handle) - an event triggers when the value is changed
     '''
     def __init__(self, iogroup, handle):
-        DigitalIoBase.__init__(self,iogroup, handle)
+        DigitalMbBase.__init__(self,iogroup, handle)
 
-        self.OnChanged = Event();
+        self.OnChanged = Event(self._longhandle + ".OnChanged");
 
     def _get(self,default=None):
         return self._trycall("GetMbInput",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetMbInput",self._handle,**kwargs)
     
     def _trigger(self,eventname, value=None):
         if eventname == "MbInputChanged":
+            self._cache(value)
             self.OnChanged(value)
         else:
             DigitalIoBase._trigger(self,eventname,value)
             
-class DigitalMbOutput(DigitalIoBase):
+class DigitalMbOutput(DigitalMbBase):
     '''
     Handler class for Multibit Outputs
 
     Attributes:
         OnChanged:     Event(handle) - an event triggers when the value is changed
+
+    Individual bits and fields can be written with masked writes (see WriteMasked, bits and fields).
     '''
     def __init__(self, iogroup, handle):
-        DigitalIoBase.__init__(self,iogroup, handle)
+        DigitalMbBase.__init__(self,iogroup, handle)
 
-        self.OnChanged = Event();
+        self.OnChanged = Event(self._longhandle + ".OnChanged");
+        # masked writes waiting to be merged into one call
+        self._pendingmask = 0
+        self._pendingbits = 0
+        # non-blocking writes sent and not answered yet
+        self._inflight = 0
 
     def _get(self,default=None):
         return self._trycall("GetMbOutput",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetMbOutput",self._handle,**kwargs)
         
     def _set(self, value):
-        return self._trycall("SetMbOutput",self._handle)
+        self._forget()
+        result = self._trycall("SetMbOutput",self._handle,value)
+        if self._iogroup.connected():
+            self._cache(value)
+        return result
+
+    def _setAsync(self, value, **kwargs):
+        # cache the value right away, so masked writes that follow build on it;
+        # forget it again when the write fails
+        self._cache(value)
+        reply_handler = kwargs.get("reply_handler")
+        error_handler = kwargs.get("error_handler")
+        def reply(*args):
+            self._done()
+            if reply_handler is not None:
+                reply_handler(*args)
+        def error(e):
+            self._done()
+            self._forget()
+            if error_handler is not None:
+                error_handler(e)
+        kwargs["reply_handler"] = reply
+        kwargs["error_handler"] = error
+        self._inflight += 1
+        try:
+            return self._asynccall("SetMbOutput",self._handle,value,**kwargs)
+        except NoConnectionError as x:
+            self._done()
+            self._forget()
+            raise
+
+    def _done(self):
+        self._inflight = max(0, self._inflight - 1)
+
+    def WriteMasked(self,mask,bits):
+        '''
+        Set the bits that are set in 'mask' to the corresponding bits of 'bits', leaving the other bits alone.
+        The new value is computed from the last known value, so no read is needed, and is sent with a single
+        non-blocking call. Masked writes done in the same main loop iteration are merged into one call.
+        '''
+        if self._pendingmask == 0:
+            gobject.idle_add(self._flushMasked)
+        self._pendingbits = (self._pendingbits & ~mask) | (bits & mask)
+        self._pendingmask |= mask
+
+    def _flushMasked(self):
+        (mask, bits) = (self._pendingmask, self._pendingbits)
+        self._pendingmask = 0
+        self._pendingbits = 0
+        try:
+            self._setAsync((self._current() & ~mask) | bits)
+        except NoConnectionError as x:
+            print "Could not write to {0} because there is currently no connection".format(self._handle)
+        return False
     
     def _trigger(self,eventname, value=None):
         if eventname == "MbOutputChanged":
+            # while own writes are in flight, the signal may echo an older one; the cache already
+            # holds the latest written value then
+            if self._inflight == 0:
+                self._cache(value)
             self.OnChanged(value)
         else:
             DigitalIoBase._trigger(self,eventname,value)
@@ -378,16 +614,280 @@ class DigitalPwm(DigitalIoBase):
     def __init__(self, iogroup, handle):
         DigitalIoBase.__init__(self,iogroup, handle)
 
-        self.OnChanged = Event();
+        self.OnChanged = Event(self._longhandle + ".OnChanged");
 
     def _get(self,default=None):
         return self._trycall("GetPwm",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetPwm",self._handle,**kwargs)
         
     def _set(self, value):
         return self._trycall("SetPwm",self._handle)
+
+    def _setAsync(self, value, **kwargs):
+        return self._asynccall("SetPwm",self._handle,value,**kwargs)
     
     def _trigger(self,eventname, value=None):
         if eventname == "PwmValueChanged":
             self.OnChanged(value)
         else:
             DigitalIoBase._trigger(self,eventname,value)
+
+
+def DecodeBits(values,width=32):
+    '''
+    Decode many multibit values at once into a NumPy array of booleans with one row per value and
+    'width' columns, column i holding bit i (bit 0 being the least significant bit).
+    Requires NumPy.
+    '''
+    # imported here, as importing NumPy takes long on small systems and most users do not need it
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("DecodeBits requires NumPy")
+    a = numpy.asarray(values, dtype=numpy.uint64)
+    return ((a[..., numpy.newaxis] >> numpy.arange(width, dtype=numpy.uint64)) & 1).astype(bool)
+
+class TimerWheel(object):
+    '''
+    Hierarchical timer wheel.
+
+    Items are kept in slots by the tick they expire at. The first level has a slot for each of the next
+    256 ticks; each following level has 64 slots that each cover a whole turn of the level below it.
+    When a level completes a turn, the next slot of the level above is cascaded down, so inserting and
+    expiring an item costs a constant amount of work regardless of the number of items.
+    '''
+
+    _bits = [8, 6, 6, 6]
+
+    def __init__(self):
+        self.now = 0
+        self._levels = [[[] for i in xrange(1 << bits)] for bits in TimerWheel._bits]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def Insert(self,expiry,item):
+        '''
+        Add an item that expires at tick 'expiry'. Items that are already due expire on the next tick.
+        '''
+        self._place(max(expiry, self.now + 1), item)
+        self._count += 1
+
+    def _place(self,expiry,item):
+        delta = expiry - self.now
+        shift = 0
+        for (level, bits) in enumerate(TimerWheel._bits):
+            if delta < (1 << (shift + bits)) or level == len(TimerWheel._bits) - 1:
+                # items beyond the range of the wheel wait in the last slot and are placed again on cascade
+                slot = min(expiry, self.now + (1 << (shift + bits)) - 1)
+                self._levels[level][(slot >> shift) & ((1 << bits) - 1)].append((expiry, item))
+                return
+            shift += bits
+
+    def _cascade(self,level):
+        shift = sum(TimerWheel._bits[:level])
+        index = (self.now >> shift) & ((1 << TimerWheel._bits[level]) - 1)
+        slot = self._levels[level][index]
+        self._levels[level][index] = []
+        for (expiry, item) in slot:
+            self._place(expiry, item)
+        if index == 0 and level + 1 < len(TimerWheel._bits):
+            self._cascade(level + 1)
+
+    def Advance(self,target):
+        '''
+        Move the wheel forward to tick 'target'. Returns a list of the items that expired, in order
+        '''
+        expired = []
+        while self.now < target:
+            self.now += 1
+            index = self.now & ((1 << TimerWheel._bits[0]) - 1)
+            if index == 0:
+                self._cascade(1)
+            slot = self._levels[0][index]
+            if slot:
+                self._levels[0][index] = []
+                self._count -= len(slot)
+                expired.extend(item for (expiry, item) in slot)
+        return expired
+
+
+class _TimedAction(object):
+    '''
+    A pending sequence of timed writes to one IO
+    '''
+    def __init__(self,io,steps,repeat):
+        self.io = io
+        self.steps = steps
+        self.repeat = repeat
+        self.index = 0
+        self.tick = None
+        self.cancelled = False
+
+class DigitalScheduler(object):
+    '''
+    Runs timed writes (pulses, writes at a given time and repeating patterns) for any number of outputs
+    from a single timer wheel on the gobject main loop.
+
+    All writes that fall in the same tick are collected and sent in one flush, without waiting for replies;
+    when several writes for the same IO fall in one tick, only the last one is sent. The main loop timer
+    only runs while there are pending actions.
+
+    Attributes:
+        Resolution: Length of a tick in seconds
+        Sent:       Number of writes sent
+        Errors:     Number of writes that failed
+    '''
+    def __init__(self,resolution=0.01):
+        self.Resolution = resolution
+        self.Sent = 0
+        self.Errors = 0
+
+        self._start = time.time()
+        self._wheel = TimerWheel()
+        # io => list of its pending actions
+        self._pending = {}
+        # actions that are due right away
+        self._due = []
+        self._timer = None
+        self._idle = None
+
+    def _ticks(self,seconds):
+        '''
+        Get the number of ticks in 'seconds', rounded up. Durations that are a whole number of ticks
+        give exactly that number, although the division of floats may come out slightly above it.
+        '''
+        return int(math.ceil(seconds / self.Resolution - 1e-6))
+
+    def _tick(self,when):
+        '''
+        Get the first tick at or after time 'when'
+        '''
+        return self._ticks(when - self._start)
+
+    def _add(self,io,steps,when,repeat,replace):
+        if not hasattr(io, '_setAsync'):
+            raise ValueError("IO can not be written: " + str(getattr(io, "_handle", io)))
+        if replace:
+            self.Cancel(io)
+        action = _TimedAction(io, steps, repeat)
+        self._pending.setdefault(io, []).append(action)
+        self._at(action, self._tick(when))
+        return action
+
+    def _at(self,action,tick):
+        action.tick = tick
+        now = int((time.time() - self._start) / self.Resolution)
+        if self._timer is None and len(self._wheel) == 0:
+            # the wheel stands still while idle; catch up without walking all the ticks in between
+            self._wheel.now = now
+        if tick <= now:
+            self._due.append(action)
+            if self._idle is None:
+                self._idle = gobject.idle_add(self._onIdle)
+        else:
+            self._wheel.Insert(tick, action)
+            if self._timer is None:
+                self._timer = gobject.timeout_add(max(1, int(self.Resolution * 1000)), self._onTimer)
+
+    def _onIdle(self):
+        self._idle = None
+        due = self._due
+        self._due = []
+        self._flush(due)
+        return False
+
+    def _onTimer(self):
+        now = int((time.time() - self._start) / self.Resolution)
+        self._flush(self._wheel.Advance(now))
+        if len(self._wheel) == 0:
+            self._timer = None
+            return False
+        return True
+
+    def _flush(self,actions):
+        writes = {}
+        order = []
+        for action in actions:
+            if action.cancelled:
+                continue
+            (value, ms) = action.steps[action.index]
+            if not writes.has_key(action.io):
+                order.append(action.io)
+            writes[action.io] = value
+
+            # move on to the next step, timed from when this step was due rather than when it ran
+            action.index += 1
+            if action.index >= len(action.steps) and action.repeat:
+                action.index = 0
+            if action.index < len(action.steps) and ms is not None:
+                self._at(action, action.tick + max(1, self._ticks(ms / 1000.0)))
+            else:
+                self._done(action)
+
+        for io in order:
+            self.Sent += 1
+            try:
+                io._setAsync(writes[io], error_handler=self._onError)
+            except Exception as x:
+                # a failing write must not take down the timer shared by all other IO
+                self.Errors += 1
+                if not isinstance(x, NoConnectionError):
+                    print "Timed write to {0} failed: {1}".format(io._handle, x)
+
+    def _onError(self,error):
+        self.Errors += 1
+
+    def _done(self,action):
+        actions = self._pending.get(action.io)
+        if actions is not None and action in actions:
+            actions.remove(action)
+            if not actions:
+                del self._pending[action.io]
+
+    def Pulse(self,io,ms,value=True,restore=False,replace=True):
+        '''
+        Set 'io' to 'value' now and to 'restore' after 'ms' milliseconds
+        '''
+        return self._add(io, [(value, ms), (restore, None)], time.time(), False, replace)
+
+    def SetAt(self,io,when,value,replace=True):
+        '''
+        Set 'io' to 'value' at time 'when' (as returned by time.time())
+        '''
+        return self._add(io, [(value, None)], when, False, replace)
+
+    def Pattern(self,io,steps,repeat=False,replace=True):
+        '''
+        Run a list of (value, ms) steps on 'io', starting now. When 'repeat' is True the pattern loops until cancelled
+        '''
+        if not steps:
+            raise ValueError("Pattern needs at least one step")
+        return self._add(io, list(steps), time.time(), repeat, replace)
+
+    def Cancel(self,io):
+        '''
+        Cancel all pending actions for 'io'
+        '''
+        for action in self._pending.pop(io, []):
+            action.cancelled = True
+
+    def Pending(self,io):
+        '''
+        Get the number of pending actions for 'io'
+        '''
+        return len(self._pending.get(io, []))
+
+_scheduler = None
+
+def Scheduler():
+    '''
+    Get the scheduler that is shared by the timed write methods of all IO
+    '''
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = DigitalScheduler()
+    return _scheduler
@@ -0,0 +1,220 @@
+import threading
+import collections
+import gobject
+import dbus
+import dbus.mainloop.glib
+
+from _piio import PiIo
+from _callscheduler import PRIORITY_CRITICAL, PRIORITY_INTERACTIVE
+
+class Future(object):
+    '''
+    The result of a call submitted to a PiIoThread, which becomes available later
+    '''
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self,timeout=None):
+        '''
+        Wait for the call to complete and return its result.
+        Throws the exception of the call if it failed, or RuntimeError when 'timeout' seconds passed
+        '''
+        self._done.wait(timeout)
+        if not self._done.is_set():
+            raise RuntimeError("Timed out waiting for result")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self,timeout=None):
+        '''
+        Wait for the call to complete and return the exception it failed with, or None
+        '''
+        self._done.wait(timeout)
+        if not self._done.is_set():
+            raise RuntimeError("Timed out waiting for result")
+        return self._exception
+
+    def add_done_callback(self,callback):
+        '''
+        Call 'callback' with this future when the call completes. Note that the callback
+        runs on the IO thread, unless the call was already complete.
+        '''
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _complete(self,result=None,exception=None):
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+    def _set_result(self,*args):
+        # dbus reply handler; gets no arguments for methods without return value
+        self._complete(result=args[0] if len(args) == 1 else (args or None))
+
+    def _set_exception(self,exception):
+        self._complete(exception=exception)
+
+
+class PiIoThread(object):
+    '''
+    Runs the connection to the piio server and a gobject main loop on a dedicated IO thread,
+    and lets any other thread submit calls to it.
+
+    Submitted calls are queued without taking a lock in the common case, and executed on the IO thread
+    as non-blocking calls, so calls from many threads are pipelined onto the bus instead of waiting on
+    each other. Each submission returns a Future.
+
+    Attributes:
+        piio:   The PiIo object, owned by the IO thread. Event listeners registered on it or on any
+                of its IO Groups are called on the IO thread.
+
+    Note that the application should not run a gobject main loop of its own while a PiIoThread is active.
+    '''
+    def __init__(self,address=None):
+        '''
+        Start the IO thread and connect to the piio server, on the system bus or at the specified D-Bus address
+        '''
+        gobject.threads_init()
+        dbus.mainloop.glib.threads_init()
+
+        self.piio = None
+        self._address = address
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup = False
+        self._loop = None
+        self._error = None
+
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="piio-io")
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            self._loop = gobject.MainLoop()
+            self.piio = PiIo(address=self._address)
+        except Exception as x:
+            self._error = x
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run()
+
+    def stop(self):
+        '''
+        Stop the main loop and wait for the IO thread to finish
+        '''
+        self.Submit(self._loop.quit)
+        self._thread.join()
+
+    def _submit(self,function,args,future):
+        self._queue.append((function, args, future))
+        # only the first submission after a drain has to wake up the IO thread
+        with self._lock:
+            if self._wakeup:
+                return
+            self._wakeup = True
+        gobject.idle_add(self._drain)
+
+    def _drain(self):
+        # runs on the IO thread
+        with self._lock:
+            self._wakeup = False
+        while True:
+            try:
+                (function, args, future) = self._queue.popleft()
+            except IndexError:
+                break
+            try:
+                function(future, *args)
+            except Exception as x:
+                future._set_exception(x)
+        return False
+
+    def Submit(self,function,*args,**kwargs):
+        '''
+        Run function(*args, **kwargs) on the IO thread. Returns a Future for its return value
+        '''
+        future = Future()
+        self._submit(lambda future: future._complete(result=function(*args, **kwargs)), (), future)
+        return future
+
+    def Call(self,obj,method,*args,**kwargs):
+        '''
+        Call dbus method 'method' on 'obj' (a PiIo object, IO Group or IO object) without blocking the IO thread.
+        The 'interface' and 'priority' keyword arguments are passed on. Returns a Future for the reply
+        '''
+        future = Future()
+        self._submit(self._call, (obj, method, args, kwargs), future)
+        return future
+
+    def Get(self,longhandle,priority=PRIORITY_INTERACTIVE):
+        '''
+        Get the value of the IO with the specified long handle, in the call priority class 'priority'.
+        Returns a Future for the value
+        '''
+        future = Future()
+        self._submit(self._get, (longhandle, priority), future)
+        return future
+
+    def Set(self,longhandle,value,priority=PRIORITY_CRITICAL):
+        '''
+        Set the value of the IO with the specified long handle, in the call priority class 'priority'.
+        Returns a Future that completes when the server replied
+        '''
+        future = Future()
+        self._submit(self._set, (longhandle, value, priority), future)
+        return future
+
+    def Stream(self,pattern='*',maxsize=10000,coalesce=False,group=None):
+        '''
+        Create a PiIoStream on the IO thread, of the root events of the piio object or, when 'group' is
+        the name of an IO Group, of all events of that group. See PiIo.Stream for the other arguments.
+        Batches can then be pulled from any thread
+        '''
+        return self.Submit(self._stream, pattern, maxsize, coalesce, group).result()
+
+    # the following run on the IO thread
+
+    def _stream(self,pattern,maxsize,coalesce,group):
+        source = self.piio
+        if group is not None:
+            source = self.piio.IoGroup(group)
+            if source is None:
+                raise KeyError("No such IO Group: " + group)
+        return source.Stream(pattern, maxsize, coalesce)
+
+    def _find(self,longhandle):
+        o = self.piio.Find(longhandle)
+        if o is None:
+            raise KeyError("No such IO: " + longhandle)
+        return o
+
+    def _call(self,future,obj,method,args,kwargs):
+        obj._asynccall(method, *args, reply_handler=future._set_result, error_handler=future._set_exception, **kwargs)
+
+    def _get(self,future,longhandle,priority):
+        self._find(longhandle)._getAsync(reply_handler=future._set_result, error_handler=future._set_exception, priority=priority)
+
+    def _set(self,future,longhandle,value,priority):
+        self._find(longhandle)._setAsync(value, reply_handler=future._set_result, error_handler=future._set_exception, priority=priority)
@@ -0,0 +1,233 @@
+import thread
+import threading
+import gobject
+import dbus
+import dbus.mainloop.glib
+
+from _event import Event
+from _piio import PiIo, PiIoDict
+
+class PiIoNode(object):
+    '''
+    A single piio server as part of a PiIoMulti client
+
+    Attributes:
+        Name:            The name of this node in the PiIoMulti namespace
+        Address:         The D-Bus address of the bus the piio server of this node lives on
+        State:           One of the PiIoNode.STATE_... values; 'lost' when the bus or the piio server on it went away
+        Error:           Description of the last connection error, or None
+        piio:            The PiIo object for this node, or None when the node is not connected
+        groups:          The IO Groups of this node, by name
+        OnStateChanged:  Event(node, state) - an event triggers when the connection state of this node changed
+
+    IO Groups can also be accessed as attributes of the node (node.group).
+    '''
+
+    STATE_CONNECTING = 'connecting'
+    STATE_CONNECTED = 'connected'
+    STATE_FAILED = 'failed'
+    STATE_LOST = 'lost'
+
+    def __init__(self,name,address,timeout=10.0,retry=30.0):
+        self.Name = name
+        self.Address = address
+        self.State = None
+        self.Error = None
+        self.piio = None
+        self.groups = PiIoDict()
+        self.OnStateChanged = Event("OnStateChanged") # arguments: node, state
+
+        self._timeout = timeout
+        self._retry = retry
+        self._worker = None
+        self._attempt = 0
+
+    def __getattr__(self, name):
+        # only called for names that are not a normal attribute; try IO Groups that appeared after discovery
+        if name.startswith('_') or self.__dict__.get('piio') is None:
+            raise AttributeError("No such attribute: " + name)
+        g = self.piio.IoGroup(name)
+        if g is None:
+            raise AttributeError("No such IO Group: " + name)
+        self.groups[name] = g
+        return g
+
+    def Find(self,handle):
+        '''
+        Get the IO object for the specified long handle of the form [iogroup].[handlename], or None if it does not exist
+        '''
+        if self.piio is None:
+            return None
+        return self.piio.Find(handle)
+
+    def connected(self):
+        return self.State == PiIoNode.STATE_CONNECTED
+
+    def _setState(self,state,error=None):
+        self.Error = error
+        if state != self.State:
+            self.State = state
+            self.OnStateChanged(self, state)
+
+    def _connect(self):
+        '''
+        Start connecting to the node on a worker thread, so a slow or dead node does not block the main loop or other nodes
+        '''
+        if self._worker is not None and self._worker.is_alive():
+            # previous attempt is still hanging; leave it be and try again later
+            return
+
+        self._attempt += 1
+        self._setState(PiIoNode.STATE_CONNECTING)
+        self._worker = threading.Thread(target=self._discover, args=(self._attempt,), name="piio-node-" + self.Name)
+        self._worker.daemon = True
+        self._worker.start()
+        gobject.timeout_add(int(self._timeout * 1000), self._onTimeout, self._attempt)
+
+    def _discover(self,attempt):
+        # runs on the worker thread; hand the result back to the main loop
+        try:
+            piio = PiIo(address=self.Address)
+            groups = [(g.Name, g) for g in piio.IoGroups()]
+        except Exception as x:
+            gobject.idle_add(self._onDiscoverFailed, attempt, str(x))
+        else:
+            gobject.idle_add(self._onDiscovered, piio, groups)
+
+    def _onDiscovered(self,piio,groups):
+        # the objects were built on the worker thread, but their signals are delivered by this main loop
+        owner = thread.get_ident()
+        piio._ownerthread = owner
+        for g in piio._groups.values():
+            g._ownerthread = owner
+
+        self.piio = piio
+        self.groups = PiIoDict()
+        for (name, g) in groups:
+            self.groups[name] = g
+
+        # a remote bus can go away without the piio server ever leaving it
+        piio._dbus.call_on_disconnection(self._onDisconnected)
+        # and the piio server can leave a bus that stays up; the PiIo object reconnects by itself when it returns
+        piio._dbus_object.connect_to_signal('NameOwnerChanged',
+                                            lambda name, old, new, piio=piio: self._onNameOwnerChanged(piio),
+                                            arg0=piio._service)
+
+        self._setState(PiIoNode.STATE_CONNECTED)
+        return False
+
+    def _onDiscoverFailed(self,attempt,error):
+        if attempt == self._attempt:
+            self._setState(PiIoNode.STATE_FAILED, error)
+            gobject.timeout_add(int(self._retry * 1000), self._onRetry)
+        return False
+
+    def _onTimeout(self,attempt):
+        if attempt == self._attempt and self.State == PiIoNode.STATE_CONNECTING:
+            self._setState(PiIoNode.STATE_FAILED, "Timed out connecting to {0}".format(self.Address))
+            gobject.timeout_add(int(self._retry * 1000), self._onRetry)
+        return False
+
+    def _onDisconnected(self,connection):
+        self.piio = None
+        self.groups = PiIoDict()
+        self._setState(PiIoNode.STATE_LOST, "Lost connection to {0}".format(self.Address))
+        gobject.timeout_add(int(self._retry * 1000), self._onRetry)
+
+    def _onNameOwnerChanged(self,piio):
+        # let the PiIo object process the change first
+        gobject.idle_add(self._onServiceChanged, piio)
+
+    def _onServiceChanged(self,piio):
+        if piio is self.piio and self.State in (PiIoNode.STATE_CONNECTED, PiIoNode.STATE_LOST):
+            if piio.connected():
+                self._setState(PiIoNode.STATE_CONNECTED)
+            else:
+                self._setState(PiIoNode.STATE_LOST, "piio server left the bus at {0}".format(self.Address))
+        return False
+
+    def _onRetry(self):
+        if self.State in (PiIoNode.STATE_FAILED, PiIoNode.STATE_LOST):
+            self._connect()
+        return False
+
+
+class PiIoMulti(object):
+    '''
+    Aggregating client for the piio servers on several nodes
+
+    Attributes:
+        nodes:              The nodes of this client, by name
+        OnButtonPress:      Event(handle) - an event triggers when a button is pressed on any node
+        OnButtonHold:       Event(handle) - an event triggers when a button is held on any node
+        OnInputChanged:     Event(handle, value) - an event triggers when an input's value changed on any node
+        OnMbInputChanged:   Event(handle, value) - an event triggers when a multibit input's value changed on any node
+        OnNodeStateChanged: Event(node, state) - an event triggers when the connection state of a node changed
+
+    Note that the handle provided on these events is the node qualified long handle consisting of [node].[iogroup].[handlename].
+    Nodes can also be accessed as attributes (multi.node.group), and IO objects by item (multi['node.group.handle']).
+    '''
+    def __init__(self,addresses,timeout=10.0,retry=30.0):
+        '''
+        Initialize a client for the nodes in 'addresses', a dict of node name to D-Bus address.
+        Nodes are connected to in parallel; a node that does not respond within 'timeout' seconds
+        is marked as failed, and failed or lost nodes are retried every 'retry' seconds.
+        Requires a running gobject main loop.
+        '''
+        self.OnButtonPress = Event("OnButtonPress")
+        self.OnButtonHold = Event("OnButtonHold")
+        self.OnInputChanged = Event("OnInputChanged")
+        self.OnMbInputChanged = Event("OnMbInputChanged")
+        self.OnNodeStateChanged = Event("OnNodeStateChanged")
+
+        # nodes are connected on worker threads
+        gobject.threads_init()
+        dbus.mainloop.glib.threads_init()
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+
+        self.nodes = PiIoDict()
+        for (name, address) in addresses.items():
+            node = PiIoNode(name, address, timeout=timeout, retry=retry)
+            node.OnStateChanged += self._onNodeStateChanged
+            self.nodes[name] = node
+
+        for node in self.nodes.values():
+            node._connect()
+
+    def __getattr__(self, name):
+        # only called for names that are not a normal attribute
+        nodes = self.__dict__.get('nodes', {})
+        if not name.startswith('_') and nodes.has_key(name):
+            return nodes[name]
+        raise AttributeError("No such attribute: " + name)
+
+    def __getitem__(self, handle):
+        o = self.Find(handle)
+        if o is None:
+            raise KeyError(handle)
+        return o
+
+    def Find(self,handle):
+        '''
+        Get the IO object for the specified node qualified long handle of the form [node].[iogroup].[handlename],
+        or None if it does not exist or its node is currently not connected
+        '''
+        (nodename, sep, longhandle) = handle.partition('.')
+        if not self.nodes.has_key(nodename):
+            return None
+        return self.nodes[nodename].Find(longhandle)
+
+    def States(self):
+        '''
+        Get a dict of node name to connection state for all nodes
+        '''
+        return dict((name, node.State) for (name, node) in self.nodes.items())
+
+    def _onNodeStateChanged(self,node,state):
+        if state == PiIoNode.STATE_CONNECTED:
+            prefix = node.Name + "."
+            node.piio.OnButtonPress += lambda handle: self.OnButtonPress(prefix + handle)
+            node.piio.OnButtonHold += lambda handle: self.OnButtonHold(prefix + handle)
+            node.piio.OnInputChanged += lambda handle, value: self.OnInputChanged(prefix + handle, value)
+            node.piio.OnMbInputChanged += lambda handle, value: self.OnMbInputChanged(prefix + handle, value)
+        self.OnNodeStateChanged(node, state)
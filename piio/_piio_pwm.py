@@ -17,7 +17,12 @@ class PiIoGroupPwm (PiIoGroup):
     Note that the handle provided on these events is the short handle relative to this IO Group.
         
     '''
-    def __init__(self,path):
+
+    _bindsources = [('pwms', 'PwmValueChanged')]
+    _bindtargets = ['pwms']
+    _handledicts = ['pwms']
+
+    def __init__(self,path,silent=False,address=None,rootdispatch=False):
         '''
         Initialize the object for a Digital IO Group connection
         '''
@@ -25,10 +30,10 @@ class PiIoGroupPwm (PiIoGroup):
         self._dbus_itf_iogroup_pwm='nl.miqra.PiIo.IoGroup.Pwm'
 
         # declare events
-        self.PwmValueChanged = Event() # arguments: handle, value
+        self.PwmValueChanged = Event("PwmValueChanged") # arguments: handle, value
         self.pwms = PiIoDict()
 
-        PiIoGroup.__init__(self,path)
+        PiIoGroup.__init__(self,path,silent=silent,address=address,rootdispatch=rootdispatch)
 
     def _init_busobject(self,busobject):
         PiIoGroup._init_busobject(self,busobject)
@@ -52,6 +57,7 @@ class PiIoGroupPwm (PiIoGroup):
     def _pwmValueChanged(self,handle, value):
         """ gets called when a pwm pin has it's value changed
         """
+        self._fireBindings("PwmValueChanged", handle, value)
         self.pwms[handle]._trigger("PwmValueChanged");
         self.PwmValueChanged(handle, value)
 
@@ -68,7 +74,8 @@ class PwmOutput(object):
     def __init__(self,iogroup,handle):
         self._iogroup = iogroup
         self._handle = handle
-        self.OnChanged = Event();
+        # named after the long handle, so profiling tells which group fired
+        self.OnChanged = Event(iogroup._longHandle(handle) + ".OnChanged");
 		
 		
     def Name(self):
@@ -141,9 +148,20 @@ class PwmOutput(object):
 
     def _get(self,default=None):
         return self._trycall("GetValue",self._handle,default=default)
+
+    def _getAsync(self, **kwargs):
+        return self._asynccall("GetValue",self._handle,**kwargs)
         
     def _set(self, value):
         return self._trycall("SetValue",self._handle,value)
+
+    # call a function on the IO Group without waiting for the reply
+    def _asynccall(self, method, *args, **kwargs):
+        kwargs['interface'] = self._iogroup._dbus_itf_iogroup_pwm
+        return self._iogroup._asynccall(method, *args, **kwargs)
+
+    def _setAsync(self, value, **kwargs):
+        return self._asynccall("SetValue",self._handle,value,**kwargs)
     
     def _trigger(self,value=None):
 		self.OnChanged(value)
@@ -0,0 +1,331 @@
+'''
+Recording of the signal stream of a piio server to a compact binary log, and replay of such a log
+into the dispatch path of the client.
+
+Log format (all little endian): the magic 'PIIOREC1', followed by records that each start with a tag byte.
+
+    TAG_STRING:  id (H), length (H), utf-8 bytes     - interns a group name or handle; id 0 is the empty string
+    TAG_SIGNAL:  signal (B), dt (I), source (H), handle (H), then a value depending on the tag:
+        TAG_SIGNAL          no value (button signals)
+        TAG_SIGNAL_FALSE    False
+        TAG_SIGNAL_TRUE     True
+        TAG_SIGNAL_INT      integer value (q)
+    TAG_SKIP:    dt (Q) - time gap too large for a signal record
+
+'dt' is the number of microseconds since the previous record, 'source' the interned name of the
+IO Group that sent the signal (the empty string for the main piio object), and 'signal' an index in SIGNALS.
+'''
+
+import time
+import struct
+import traceback
+import gobject
+import dbus
+
+from _event import Event
+from _latency import LatencyStats
+from _piio import PiIo
+
+MAGIC = 'PIIOREC1'
+
+TAG_STRING = 1
+TAG_SKIP = 2
+TAG_SIGNAL = 16
+TAG_SIGNAL_FALSE = 17
+TAG_SIGNAL_TRUE = 18
+TAG_SIGNAL_INT = 19
+
+# recorded signals with the handler that dispatches them on the main piio object or an IO Group
+SIGNALS = [
+    ('OnButtonPress',       '_onButtonPress'),
+    ('OnButtonHold',        '_onButtonHold'),
+    ('OnInputChanged',      '_onInputChanged'),
+    ('OnMbInputChanged',    '_onMbInputChanged'),
+    ('ButtonPress',         '_buttonPress'),
+    ('ButtonHold',          '_buttonHold'),
+    ('InputChanged',        '_inputChanged'),
+    ('OutputChanged',       '_outputChanged'),
+    ('MbInputChanged',      '_mbInputChanged'),
+    ('MbOutputChanged',     '_mbOutputChanged'),
+    ('PwmValueChanged',     '_pwmValueChanged'),
+]
+
+_handlers = dict(SIGNALS)
+
+# group signal => handle dict on the IO Group that holds its IO
+_handledicts = {
+    'ButtonPress':      'buttons',
+    'ButtonHold':       'buttons',
+    'InputChanged':     'inputs',
+    'OutputChanged':    'outputs',
+    'MbInputChanged':   'mbinputs',
+    'MbOutputChanged':  'mboutputs',
+    'PwmValueChanged':  'pwms',
+}
+
+# group signals that a PiIo object in rootdispatch mode passes on from the root signals itself
+_rootdispatched = set(signal[2:] for signal in PiIo._grouphandlers.keys())
+
+_STRING = struct.Struct('<BHH')
+_SIGNAL = struct.Struct('<BBIHH')
+_INT = struct.Struct('<q')
+_SKIP = struct.Struct('<BQ')
+
+class PiIoRecorder(object):
+    '''
+    Records all signals of a PiIo object and its IO Groups to a binary log
+
+    Attributes:
+        Records:    Number of signals recorded
+    '''
+    def __init__(self,piio,path,buffersize=65536,flushinterval=1.0):
+        '''
+        Start recording the signals of 'piio' and all its IO Groups to the file at 'path'.
+        Records are buffered up to 'buffersize' bytes, and written at least every 'flushinterval' seconds.
+        '''
+        self.Records = 0
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._buffer = []
+        self._buffered = 0
+        self._buffersize = buffersize
+        self._strings = {'': 0}
+        self._last = time.time()
+        self._listeners = []
+
+        signals = dict((name, index) for (index, (name, handler)) in enumerate(SIGNALS))
+        sources = [('', piio)] + [(g.Name, g) for g in piio.IoGroups()]
+        for (sourcename, source) in sources:
+            for (name, index) in signals.items():
+                event = getattr(source, name, None)
+                if isinstance(event, Event):
+                    listener = self._recorder(index, self._intern(sourcename))
+                    event += listener
+                    self._listeners.append((event, listener))
+
+        self._timer = gobject.timeout_add(int(flushinterval * 1000), self._onFlushTimer)
+
+    def close(self):
+        '''
+        Stop recording, write out the buffer and close the log
+        '''
+        if self._file is None:
+            return
+        for (event, listener) in self._listeners:
+            event -= listener
+        self._listeners = []
+        gobject.source_remove(self._timer)
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def flush(self):
+        '''
+        Write out the buffered records
+        '''
+        if self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._file.flush()
+            self._buffer = []
+            self._buffered = 0
+
+    def _onFlushTimer(self):
+        self.flush()
+        return True
+
+    def _write(self,data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._buffersize:
+            self.flush()
+
+    def _intern(self,string):
+        index = self._strings.get(string)
+        if index is None:
+            index = len(self._strings)
+            if index > 0xffff:
+                raise ValueError("Too many distinct handles to record")
+            self._strings[string] = index
+            data = unicode(string).encode('utf-8')
+            self._write(_STRING.pack(TAG_STRING, index, len(data)) + data)
+        return index
+
+    def _recorder(self,signal,source):
+        def record(handle, value=None):
+            self._record(signal, source, handle, value)
+        return record
+
+    def _record(self,signal,source,handle,value):
+        now = time.time()
+        dt = int(round((now - self._last) * 1000000))
+        if dt < 0:
+            # clock stepped back; keep the log monotonic
+            dt = 0
+        self._last = now
+        if dt > 0xffffffff:
+            self._write(_SKIP.pack(TAG_SKIP, dt))
+            dt = 0
+
+        handle = self._intern(handle)
+        if value is None:
+            self._write(_SIGNAL.pack(TAG_SIGNAL, signal, dt, source, handle))
+        elif isinstance(value, (bool, dbus.Boolean)):
+            self._write(_SIGNAL.pack(TAG_SIGNAL_TRUE if value else TAG_SIGNAL_FALSE, signal, dt, source, handle))
+        else:
+            self._write(_SIGNAL.pack(TAG_SIGNAL_INT, signal, dt, source, handle) + _INT.pack(int(value)))
+        self.Records += 1
+
+
+def ReadLog(path):
+    '''
+    Iterate over the signals in a log, as (seconds since start, source, signal name, handle, value) tuples.
+    'source' is the IO Group name, or the empty string for the main piio object.
+    '''
+    f = open(path, 'rb')
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a piio signal log".format(path))
+        strings = {0: ''}
+        t = 0
+        while True:
+            tag = f.read(1)
+            if not tag:
+                break
+            tag = ord(tag)
+            if tag == TAG_STRING:
+                (index, length) = struct.unpack('<HH', f.read(4))
+                strings[index] = f.read(length).decode('utf-8')
+            elif tag == TAG_SKIP:
+                t += struct.unpack('<Q', f.read(8))[0]
+            else:
+                (signal, dt, source, handle) = struct.unpack('<BIHH', f.read(9))
+                t += dt
+                if tag == TAG_SIGNAL_INT:
+                    value = _INT.unpack(f.read(8))[0]
+                elif tag == TAG_SIGNAL_TRUE:
+                    value = True
+                elif tag == TAG_SIGNAL_FALSE:
+                    value = False
+                else:
+                    value = None
+                yield (t / 1000000.0, strings[source], SIGNALS[signal][0], strings[handle], value)
+    finally:
+        f.close()
+
+
+class PiIoReplayer(object):
+    '''
+    Replays a signal log into the dispatch path of a PiIo object and its IO Groups, as if the signals
+    came from the server: bindings, IO object events and group events all fire.
+
+    When 'piio' is in rootdispatch mode, the root signals already reach the IO Groups, so the group records of
+    those signals are skipped instead of being dispatched a second time.
+
+    Attributes:
+        Dispatched:     Number of signals replayed
+        Skipped:        Number of signals for IO Groups or handles that are not known, or that reach
+                        their IO Group through a root signal
+        Errors:         Number of signals whose dispatch raised an exception in a listener; like dbus
+                        does for live signals, the exception is printed and replay goes on
+        Lateness:       LatencyStats of how late signals were dispatched compared to the schedule
+        OnFinished:     Event() - an event triggers when the whole log was replayed
+    '''
+    def __init__(self,piio,path,speed=1.0,groups=None,batch=1000):
+        '''
+        Prepare replay of the log at 'path' into 'piio'. 'speed' is the replay speed relative to the recording;
+        None replays as fast as possible, 'batch' signals per main loop iteration. IO Groups are looked up
+        through 'piio' by name, unless a dict of name to IO Group is given in 'groups'.
+        '''
+        self.Dispatched = 0
+        self.Skipped = 0
+        self.Errors = 0
+        self.Lateness = LatencyStats()
+        self.OnFinished = Event("OnFinished")
+
+        self._piio = piio
+        self._path = path
+        self._speed = speed
+        self._groups = dict(groups) if groups is not None else {}
+        self._batch = batch
+        self._log = None
+        self._next = None
+        self._start = None
+        self._source = None
+
+    def start(self):
+        '''
+        Start replaying from the gobject main loop
+        '''
+        self._log = ReadLog(self._path)
+        self._next = next(self._log, None)
+        self._start = time.time()
+        self._schedule()
+
+    def stop(self):
+        '''
+        Stop replaying
+        '''
+        if self._source is not None:
+            gobject.source_remove(self._source)
+            self._source = None
+        self._log = None
+
+    def _schedule(self):
+        if self._next is None:
+            self._source = None
+            self._log = None
+            self.OnFinished()
+        elif self._speed is None:
+            self._source = gobject.idle_add(self._onDue)
+        else:
+            delay = self._start + self._next[0] / self._speed - time.time()
+            self._source = gobject.timeout_add(max(0, int(delay * 1000)), self._onDue)
+
+    def _onDue(self):
+        now = time.time()
+        count = 0
+        while self._next is not None and count < self._batch:
+            if self._speed is not None:
+                due = self._start + self._next[0] / self._speed
+                if due > now:
+                    break
+                self.Lateness.Record(now - due)
+            try:
+                self._dispatch(*self._next)
+            except Exception as x:
+                self.Errors += 1
+                traceback.print_exc()
+            count += 1
+            self._next = next(self._log, None)
+        self._schedule()
+        return False
+
+    def _target(self,source):
+        if source == '':
+            return self._piio
+        if source not in self._groups:
+            # also remember groups that are not there, so they are looked up only once
+            self._groups[source] = self._piio.IoGroup(source)
+        return self._groups[source]
+
+    def _dispatch(self,t,source,signal,handle,value):
+        target = self._target(source)
+        if target is None:
+            self.Skipped += 1
+            return
+        if source != '':
+            if not getattr(target, _handledicts[signal], {}).has_key(handle):
+                # handle not known to this group
+                self.Skipped += 1
+                return
+            if signal in _rootdispatched and self._piio._rootdispatch and self._piio._lookup(source + "." + handle) is not None:
+                # the root record of this signal already reached the group
+                self.Skipped += 1
+                return
+        handler = getattr(target, _handlers[signal])
+        if value is None:
+            handler(handle)
+        else:
+            handler(handle, value)
+        self.Dispatched += 1
@@ -0,0 +1,117 @@
+'''
+Bundled description of the dbus interfaces of the piio server.
+
+With these signatures the client does not need to introspect the objects on the server before
+calling methods on them. Use VerifySchema (or PiIo.VerifySchema) to check them against a live server.
+The integer types of the multibit and PWM values are not confirmed against the server; when the server
+rejects a call marshalled with them, the object falls back to introspection (see DBusSmartObject).
+'''
+
+import xml.etree.ElementTree as ElementTree
+
+# interface => {'methods': {name: (in signature, out signature)}, 'signals': {name: signature}}
+INTERFACES = {
+    'nl.miqra.PiIo': {
+        'methods': {
+            'IoGroups':     ('', 'ao'),
+        },
+        'signals': {
+            'OnButtonPress':    's',
+            'OnButtonHold':     's',
+            'OnInputChanged':   'sb',
+            'OnMbInputChanged': 'si',
+        },
+    },
+    'nl.miqra.PiIo.IoGroup': {
+        'methods': {
+            'Name':         ('', 's'),
+            'Interface':    ('', 's'),
+        },
+        'signals': {},
+    },
+    'nl.miqra.PiIo.IoGroup.Digital': {
+        'methods': {
+            'Buttons':      ('', 'as'),
+            'Inputs':       ('', 'as'),
+            'Outputs':      ('', 'as'),
+            'MbInputs':     ('', 'as'),
+            'MbOutputs':    ('', 'as'),
+            'Pwms':         ('', 'as'),
+            'GetButton':    ('s', 'b'),
+            'GetInput':     ('s', 'b'),
+            'GetOutput':    ('s', 'b'),
+            'SetOutput':    ('sb', ''),
+            'GetMbInput':   ('s', 'i'),
+            'GetMbOutput':  ('s', 'i'),
+            'SetMbOutput':  ('si', ''),
+            'GetPwm':       ('s', 'i'),
+            'SetPwm':       ('si', ''),
+        },
+        'signals': {
+            'ButtonPress':      's',
+            'ButtonHold':       's',
+            'InputChanged':     'sb',
+            'OutputChanged':    'sb',
+            'MbInputChanged':   'si',
+            'MbOutputChanged':  'si',
+            'PwmValueChanged':  'si',
+        },
+    },
+    'nl.miqra.PiIo.IoGroup.Pwm': {
+        'methods': {
+            'Pwms':         ('', 'as'),
+            'GetValue':     ('s', 'i'),
+            'SetValue':     ('si', ''),
+            'GetMin':       ('s', 'i'),
+            'GetMax':       ('s', 'i'),
+        },
+        'signals': {
+            'PwmValueChanged':  'si',
+        },
+    },
+}
+
+# interface => {method: in signature}, as used for marshalling arguments
+SIGNATURES = dict((interface, dict((name, sigs[0]) for (name, sigs) in spec['methods'].items()))
+                  for (interface, spec) in INTERFACES.items())
+
+def _parse(xml):
+    '''
+    Parse introspection data into the same form as INTERFACES
+    '''
+    interfaces = {}
+    root = ElementTree.fromstring(xml)
+    for itf in root.findall('interface'):
+        methods = {}
+        signals = {}
+        for m in itf.findall('method'):
+            insig = ''.join(a.get('type') for a in m.findall('arg') if a.get('direction', 'in') == 'in')
+            outsig = ''.join(a.get('type') for a in m.findall('arg') if a.get('direction') == 'out')
+            methods[m.get('name')] = (insig, outsig)
+        for s in itf.findall('signal'):
+            signals[s.get('name')] = ''.join(a.get('type') for a in s.findall('arg'))
+        interfaces[itf.get('name')] = {'methods': methods, 'signals': signals}
+    return interfaces
+
+def VerifySchema(xml,path=''):
+    '''
+    Compare introspection data of an object on the server with the bundled schema.
+    Only interfaces that are in the bundled schema are checked.
+    Returns a list of descriptions of the differences; empty when everything matches
+    '''
+    problems = []
+    live = _parse(xml)
+    for (interface, spec) in live.items():
+        if not INTERFACES.has_key(interface):
+            continue
+        bundled = INTERFACES[interface]
+        for kind in ['methods', 'signals']:
+            for (name, sig) in bundled[kind].items():
+                if not spec[kind].has_key(name):
+                    problems.append("{0}: {1}.{2} is missing on the server".format(path, interface, name))
+                elif spec[kind][name] != sig:
+                    problems.append("{0}: {1}.{2} has signature {3} on the server, bundled schema has {4}".format(path, interface, name, spec[kind][name], sig))
+            for name in spec[kind].keys():
+                if not bundled[kind].has_key(name):
+                    problems.append("{0}: {1}.{2} is not in the bundled schema".format(path, interface, name))
+    return problems
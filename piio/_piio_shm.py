@@ -0,0 +1,338 @@
+'''
+Shared memory mirror of the state of all IO in a piio system.
+
+One process runs a PiIoStatePublisher, which keeps the value of every handle of every IO Group
+in a memory mapped file. Any number of other processes attach a PiIoStateReader to that file and read
+values directly from the mapping, without a connection to the bus of their own.
+
+Layout of the file (all little endian):
+    header:     magic (8s), version (I), generation (I), capacity (I), slotcount (I), changes (Q)
+    directory:  capacity entries of long handle (64s), kind (B), padding (7x)
+    slots:      capacity entries of seq (I), count (I), value (q)
+
+Each slot is protected by its own seqlock: the publisher makes 'seq' odd before writing the slot and even
+again afterwards, so a reader that sees an odd or changed 'seq' knows it has to retry. The directory is
+protected the same way by 'generation'. 'changes' is incremented after every slot update, so readers can
+cheaply detect whether anything changed since their last look. 'count' is the number of updates of a slot.
+
+The publisher builds the file under a temporary name and renames it into place, so a restarted publisher
+never changes a file that readers of the previous one still have mapped; those readers keep the old table
+until they attach again. When a publisher dies halfway through an update, readers of that slot give up with
+a RuntimeError after a timeout instead of spinning forever.
+'''
+
+import os
+import time
+import mmap
+import struct
+
+DEFAULT_PATH = '/dev/shm/piio-state'
+
+MAGIC = 'PIIOSTAT'
+VERSION = 1
+
+KIND_BUTTON = 1
+KIND_INPUT = 2
+KIND_OUTPUT = 3
+KIND_MBINPUT = 4
+KIND_MBOUTPUT = 5
+KIND_PWM = 6
+
+# values stored for button slots, which have no state of their own
+BUTTON_PRESS = 1
+BUTTON_HOLD = 2
+
+_HEADER = struct.Struct('<8sIIIIQ')
+_GENERATION_OFFSET = 12
+_SLOTCOUNT_OFFSET = 20
+_CHANGES_OFFSET = 24
+_HANDLESIZE = 64
+_ENTRY = struct.Struct('<64sB7x')
+_SLOT = struct.Struct('<IIq')
+_UINT = struct.Struct('<I')
+_COUNTVALUE = struct.Struct('<Iq')
+_CHANGES = struct.Struct('<Q')
+
+# handle dict on the IO Group, slot kind, group event reporting changes
+_sources = [
+    ('buttons',   KIND_BUTTON,   'ButtonPress'),
+    ('buttons',   KIND_BUTTON,   'ButtonHold'),
+    ('inputs',    KIND_INPUT,    'InputChanged'),
+    ('outputs',   KIND_OUTPUT,   'OutputChanged'),
+    ('mbinputs',  KIND_MBINPUT,  'MbInputChanged'),
+    ('mboutputs', KIND_MBOUTPUT, 'MbOutputChanged'),
+    ('pwms',      KIND_PWM,      'PwmValueChanged'),
+]
+
+def _size(capacity):
+    return _HEADER.size + capacity * (_ENTRY.size + _SLOT.size)
+
+class PiIoStatePublisher(object):
+    '''
+    Keeps the state of all IO of a PiIo object in a shared memory table for PiIoStateReader objects in other processes
+
+    Attributes:
+        Path:       Path of the shared memory file
+        Dropped:    Number of updates for handles that did not fit in the table anymore,
+                    or whose long handle is longer than 64 bytes
+    '''
+    def __init__(self,piio,path=DEFAULT_PATH,capacity=None):
+        '''
+        Create the table at 'path' and start mirroring all IO Groups of 'piio' into it.
+        'capacity' is the number of slots in the table; by default there is room for the handles
+        currently known plus some spare for handles that show up after a reconnect.
+        '''
+        self.Path = path
+        self.Dropped = 0
+
+        self._index = {}
+        self._changes = 0
+
+        groups = piio.IoGroups()
+        handles = []
+        for g in groups:
+            for (dictname, kind, eventname) in _sources:
+                d = getattr(g, dictname, None)
+                if d is not None and getattr(g, eventname, None) is not None:
+                    for (handle, o) in d.items():
+                        handles.append((g.Name + "." + handle, kind, o))
+
+        if capacity is None:
+            capacity = max(2 * len(handles), len(handles) + 64)
+        self._capacity = capacity
+        self._slotcount = 0
+        self._generation = 0
+
+        # build the table under a temporary name; truncating the file in place would pull it
+        # from under readers that still have the table of a previous publisher mapped
+        tmppath = "{0}.{1}.tmp".format(path, os.getpid())
+        f = open(tmppath, 'w+b')
+        try:
+            f.truncate(_size(capacity))
+            self._map = mmap.mmap(f.fileno(), _size(capacity))
+        finally:
+            f.close()
+        self._directoryoffset = _HEADER.size
+        self._slotoffset = _HEADER.size + capacity * _ENTRY.size
+        _HEADER.pack_into(self._map, 0, MAGIC, VERSION, 0, capacity, 0, 0)
+
+        # fill in the directory and initial values
+        seen = set()
+        for (longhandle, kind, o) in handles:
+            if longhandle in seen:
+                continue
+            seen.add(longhandle)
+            index = self._addSlot(longhandle, kind)
+            if index is None:
+                self.Dropped += 1
+            elif kind != KIND_BUTTON:
+                value = o._get()
+                if value is not None:
+                    self._write(index, value)
+
+        os.rename(tmppath, path)
+
+        # follow changes
+        for g in groups:
+            prefix = g.Name + "."
+            for (dictname, kind, eventname) in _sources:
+                event = getattr(g, eventname, None)
+                if event is None:
+                    continue
+                if eventname == 'ButtonPress':
+                    event += lambda handle, prefix=prefix: self._update(prefix + handle, KIND_BUTTON, BUTTON_PRESS)
+                elif eventname == 'ButtonHold':
+                    event += lambda handle, prefix=prefix: self._update(prefix + handle, KIND_BUTTON, BUTTON_HOLD)
+                else:
+                    event += lambda handle, value, prefix=prefix, kind=kind: self._update(prefix + handle, kind, value)
+
+    def close(self):
+        '''
+        Stop publishing and remove the shared memory file
+        '''
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            try:
+                os.unlink(self.Path)
+            except OSError as x:
+                pass
+
+    def _addSlot(self,longhandle,kind):
+        name = unicode(longhandle).encode('utf-8')
+        if self._slotcount >= self._capacity or len(name) > _HANDLESIZE:
+            return None
+        index = self._slotcount
+
+        # odd generation tells readers the directory is being changed
+        self._generation += 1
+        _UINT.pack_into(self._map, _GENERATION_OFFSET, self._generation)
+        _ENTRY.pack_into(self._map, self._directoryoffset + index * _ENTRY.size, name, kind)
+        _SLOT.pack_into(self._map, self._slotoffset + index * _SLOT.size, 0, 0, 0)
+        self._slotcount += 1
+        _UINT.pack_into(self._map, _SLOTCOUNT_OFFSET, self._slotcount)
+        self._generation += 1
+        _UINT.pack_into(self._map, _GENERATION_OFFSET, self._generation)
+
+        self._index[longhandle] = index
+        return index
+
+    def _write(self,index,value):
+        m = self._map
+        offset = self._slotoffset + index * _SLOT.size
+        (seq, count, old) = _SLOT.unpack_from(m, offset)
+        _UINT.pack_into(m, offset, (seq + 1) & 0xffffffff)
+        _COUNTVALUE.pack_into(m, offset + 4, (count + 1) & 0xffffffff, int(value))
+        _UINT.pack_into(m, offset, (seq + 2) & 0xffffffff)
+        self._changes += 1
+        _CHANGES.pack_into(m, _CHANGES_OFFSET, self._changes)
+
+    def _update(self,longhandle,kind,value):
+        if self._map is None:
+            return
+        index = self._index.get(longhandle)
+        if index is None:
+            index = self._addSlot(longhandle, kind)
+            if index is None:
+                self.Dropped += 1
+                return
+        self._write(index, value)
+
+
+class _Retry(object):
+    '''
+    Counts seqlock retries, and throws RuntimeError once they have gone on for 'timeout' seconds
+    '''
+    def __init__(self,timeout,what):
+        self._deadline = time.time() + timeout
+        self._what = what
+        self._count = 0
+
+    def __call__(self):
+        self._count += 1
+        # checking the clock on every retry would slow down the common short wait
+        if self._count % 1000 == 0 and time.time() > self._deadline:
+            raise RuntimeError("The {0} of the piio state table stays in the middle of an update; the publisher probably died".format(self._what))
+
+class PiIoStateReader(object):
+    '''
+    Read-only access to the shared memory table of a PiIoStatePublisher in another process.
+
+    Values are read straight from the shared mapping; nothing is copied apart from the value itself,
+    and no connection to the bus is needed.
+    '''
+    def __init__(self,path=DEFAULT_PATH,timeout=1.0):
+        '''
+        Attach to the table at 'path'. A read that keeps finding its slot or the directory in the middle
+        of an update for 'timeout' seconds throws RuntimeError, as the publisher probably died during the update.
+        '''
+        self.Path = path
+        self._timeout = timeout
+        f = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        (magic, version, generation, capacity, slotcount, changes) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("{0} is not a piio state table".format(path))
+
+        self._directoryoffset = _HEADER.size
+        self._slotoffset = _HEADER.size + capacity * _ENTRY.size
+        self._generation = None
+        self._index = {}
+        self._kinds = {}
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _directory(self):
+        ''' Get the handle index, reloading it when the publisher added slots
+        '''
+        (generation,) = _UINT.unpack_from(self._map, _GENERATION_OFFSET)
+        if generation == self._generation:
+            return self._index
+
+        retry = _Retry(self._timeout, "directory")
+        while True:
+            (generation,) = _UINT.unpack_from(self._map, _GENERATION_OFFSET)
+            if generation & 1:
+                retry()
+                continue
+            (slotcount,) = _UINT.unpack_from(self._map, _SLOTCOUNT_OFFSET)
+            index = {}
+            kinds = {}
+            for i in xrange(slotcount):
+                (name, kind) = _ENTRY.unpack_from(self._map, self._directoryoffset + i * _ENTRY.size)
+                name = intern(name.rstrip('\0'))
+                index[name] = i
+                kinds[name] = kind
+            if _UINT.unpack_from(self._map, _GENERATION_OFFSET)[0] == generation:
+                break
+            retry()
+
+        self._generation = generation
+        self._index = index
+        self._kinds = kinds
+        return index
+
+    def _read(self,i):
+        m = self._map
+        offset = self._slotoffset + i * _SLOT.size
+        retry = None
+        while True:
+            # seq, then the contents, then seq again; each a read of its own
+            (seq,) = _UINT.unpack_from(m, offset)
+            if not seq & 1:
+                (count, value) = _COUNTVALUE.unpack_from(m, offset + 4)
+                if _UINT.unpack_from(m, offset)[0] == seq:
+                    return (value, count)
+            if retry is None:
+                retry = _Retry(self._timeout, "slot {0}".format(i))
+            retry()
+
+    def Changes(self):
+        '''
+        The total number of updates done by the publisher; changes whenever any value changes
+        '''
+        return _CHANGES.unpack_from(self._map, _CHANGES_OFFSET)[0]
+
+    def Handles(self):
+        '''
+        Get a list of the long handles in the table
+        '''
+        return self._directory().keys()
+
+    def Kind(self,longhandle):
+        '''
+        Get the kind (one of the KIND_... values) of the specified long handle
+        '''
+        self._directory()
+        return self._kinds[longhandle]
+
+    def Read(self,longhandle):
+        '''
+        Get a (value, count) tuple for the specified long handle, where 'count' is the number of updates of the handle.
+        For buttons, 'value' is the last event (BUTTON_PRESS or BUTTON_HOLD) and 'count' tells if a new one happened.
+        Throws KeyError if the handle is not in the table
+        '''
+        return self._read(self._directory()[longhandle])
+
+    def Value(self,longhandle,default=None):
+        '''
+        Get the current value of the specified long handle, or 'default' if the handle is not in the table
+        '''
+        i = self._directory().get(longhandle)
+        if i is None:
+            return default
+        return self._read(i)[0]
+
+    def Snapshot(self):
+        '''
+        Get a dict of long handle to value for all handles in the table
+        '''
+        return dict((name, self._read(i)[0]) for (name, i) in self._directory().items())
@@ -0,0 +1,215 @@
+import re
+import time
+import thread
+import fnmatch
+import threading
+import gobject
+
+# group events that are streamed; the name is used as the kind of the record
+GROUPEVENTS = ['ButtonPress', 'ButtonHold', 'InputChanged', 'OutputChanged', 'MbInputChanged', 'MbOutputChanged', 'PwmValueChanged']
+
+def _matcher(pattern):
+    '''
+    Compile a long handle pattern with shell style wildcards to the cheapest test that does the job
+    '''
+    if not re.search(r'[*?\[]', pattern):
+        return lambda longhandle: longhandle == pattern
+    elif pattern.endswith('*') and not re.search(r'[*?\[]', pattern[:-1]):
+        prefix = pattern[:-1]
+        return lambda longhandle: longhandle.startswith(prefix)
+    else:
+        return re.compile(fnmatch.translate(pattern)).match
+
+class PiIoStream(object):
+    '''
+    Buffers the changes of a PiIo object or IO Group, to be consumed in batches instead of per event.
+
+    Each change is a (timestamp, long handle, kind, value) record; 'kind' is the name of the group event
+    (e.g. 'InputChanged'), and 'value' is None for button events. Records gather in a buffer of at most
+    'maxsize' records between pulls; further records are dropped and counted in Overflow. For handles that
+    are coalesced, only the latest record per handle and kind is kept in a batch, at the place of the first.
+
+    Attributes:
+        Received:   Number of records received
+        Coalesced:  Number of records that replaced an earlier record of the same handle in a batch
+        Overflow:   Number of records dropped because the buffer was full
+
+    A stream is created on the thread that runs the main loop (PiIo.Stream, PiIoGroup.Stream or
+    PiIoThread.Stream), and records are gathered there. Batches can be pulled from that thread, in which case
+    Batches() runs the main loop while it waits, or from any other thread (e.g. with a PiIoThread).
+    '''
+    def __init__(self,maxsize=10000,coalesce=False):
+        '''
+        Create an empty stream. 'coalesce' is True to coalesce all handles, or a long handle pattern
+        or list of patterns (e.g. 'panel*.pwm*') for the handles to coalesce.
+        '''
+        self.Received = 0
+        self.Coalesced = 0
+        self.Overflow = 0
+
+        self._maxsize = maxsize
+        self._buffer = []
+        # (long handle, kind) => index in the buffer, for coalesced handles
+        self._slots = {}
+        self._matchers = []
+        # long handle => whether it is coalesced
+        self._coalescing = {}
+        self._cond = threading.Condition()
+        # the thread that runs the main loop delivering the records
+        self._thread = thread.get_ident()
+        self._last = time.time()
+        self._closed = False
+        self._listeners = []
+
+        if coalesce is True:
+            self.Coalesce('*')
+        elif isinstance(coalesce, basestring):
+            self.Coalesce(coalesce)
+        elif coalesce:
+            for pattern in coalesce:
+                self.Coalesce(pattern)
+
+    def Coalesce(self,pattern):
+        '''
+        Coalesce the records of all handles that match the long handle pattern 'pattern'
+        '''
+        self._matchers.append(_matcher(pattern))
+        self._coalescing = {}
+
+    def close(self):
+        '''
+        Stop gathering records; Batches() ends after the records still in the buffer.
+        May be called from any thread.
+        '''
+        if thread.get_ident() == self._thread:
+            self._detach()
+        else:
+            # listeners are only changed on the thread that delivers records
+            gobject.idle_add(self._detach)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _detach(self):
+        listeners = self._listeners
+        self._listeners = []
+        for detach in listeners:
+            detach()
+        return False
+
+    def _onClose(self,detach):
+        # call 'detach' when the stream is closed
+        self._listeners.append(detach)
+
+    def _listen(self,event,listener):
+        event += listener
+        def detach():
+            e = event
+            e -= listener
+        self._onClose(detach)
+
+    def _recorder(self,kind,prefix='',match=None):
+        # listener for an event with a handle and an optional value argument
+        matches = {}
+        def record(handle, value=None):
+            if match is not None:
+                ok = matches.get(handle)
+                if ok is None:
+                    ok = matches[handle] = bool(match(prefix + handle))
+                if not ok:
+                    return
+            self._record(prefix + handle, kind, value)
+        return record
+
+    def _record(self,longhandle,kind,value):
+        t = time.time()
+        coalesce = self._coalescing.get(longhandle)
+        if coalesce is None:
+            coalesce = self._coalescing[longhandle] = any(m(longhandle) for m in self._matchers)
+
+        with self._cond:
+            self.Received += 1
+            if coalesce:
+                key = (longhandle, kind)
+                index = self._slots.get(key)
+                if index is not None:
+                    self._buffer[index] = (t, longhandle, kind, value)
+                    self.Coalesced += 1
+                    return
+            if len(self._buffer) >= self._maxsize:
+                self.Overflow += 1
+                return
+            if coalesce:
+                self._slots[key] = len(self._buffer)
+            self._buffer.append((t, longhandle, kind, value))
+            if len(self._buffer) == 1:
+                self._cond.notify_all()
+
+    def Pending(self):
+        '''
+        Get the number of records in the buffer
+        '''
+        return len(self._buffer)
+
+    def Pull(self):
+        '''
+        Get the records gathered since the previous pull as a list, without waiting.
+        zip(*batch) turns a batch into columns of timestamps, long handles, kinds and values.
+        '''
+        with self._cond:
+            batch = self._buffer
+            self._buffer = []
+            self._slots = {}
+        self._last = time.time()
+        return batch
+
+    def Batches(self,interval=0.0,timeout=None):
+        '''
+        Generator of batches of records. Each batch is pulled once there are records and at least 'interval'
+        seconds passed since the previous pull, so a larger interval gives larger batches. When 'timeout' is
+        specified, an empty batch is yielded when no records came in for that many seconds.
+        The generator ends when the stream is closed.
+        '''
+        while True:
+            self._wait(interval, timeout)
+            if self._closed and not self._buffer:
+                return
+            yield self.Pull()
+
+    def __iter__(self):
+        return self.Batches()
+
+    def _due(self,interval,start,timeout):
+        # seconds until a batch should be pulled; 0 when it is due now, None when waiting for records
+        now = time.time()
+        if self._closed:
+            return 0
+        if self._buffer:
+            return max(0, self._last + interval - now)
+        if timeout is not None:
+            return max(0, start + timeout - now)
+        return None
+
+    def _wait(self,interval,timeout):
+        start = time.time()
+        if thread.get_ident() == self._thread:
+            # the records come from this thread, so run the main loop until a batch is due
+            context = gobject.main_context_default()
+            while True:
+                due = self._due(interval, start, timeout)
+                if due == 0:
+                    return
+                fired = []
+                source = None
+                if due is not None:
+                    source = gobject.timeout_add(int(due * 1000) + 1, lambda: fired.append(True))
+                context.iteration(True)
+                if source is not None and not fired:
+                    gobject.source_remove(source)
+        else:
+            with self._cond:
+                while True:
+                    due = self._due(interval, start, timeout)
+                    if due == 0:
+                        return
+                    self._cond.wait(due)
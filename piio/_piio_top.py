@@ -0,0 +1,173 @@
+'''
+piio-top: live view of the signal rates and call latency of a piio server
+'''
+
+import sys
+import time
+import json
+import optparse
+import gobject
+
+from _piio import PiIo
+from _dbus_smartobject import NoConnectionError
+from _latency import LatencyStats
+
+# group events counted per handle
+_groupevents = ['ButtonPress', 'ButtonHold', 'InputChanged', 'OutputChanged', 'MbInputChanged', 'MbOutputChanged', 'PwmValueChanged']
+# root events counted per kind
+_rootevents = ['OnButtonPress', 'OnButtonHold', 'OnInputChanged', 'OnMbInputChanged']
+
+class PiIoTop(object):
+    '''
+    Collects per handle event rates, per group totals and sampled call latency of a piio server
+    '''
+    def __init__(self,piio):
+        self._piio = piio
+
+        # long handle => [kind, total, count in current interval, rate of last interval]
+        self._handles = {}
+        # group name => [total, count in current interval, rate of last interval]
+        self._groups = {}
+        # root event => total
+        self._root = dict((name, 0) for name in _rootevents)
+        self._latency = {}
+        self._last = time.time()
+
+        for name in _rootevents:
+            event = getattr(piio, name)
+            event += self._rootCounter(name)
+
+        self._groupobjects = [(g.Name, g) for g in piio.IoGroups()]
+        for (name, g) in self._groupobjects:
+            self._groups[name] = [0, 0, 0.0]
+            self._latency[name] = LatencyStats()
+            for kind in _groupevents:
+                event = getattr(g, kind, None)
+                if event is not None:
+                    event += self._groupCounter(name, kind)
+        self._latency[''] = LatencyStats()
+
+    def _rootCounter(self,name):
+        def count(*args):
+            self._root[name] += 1
+        return count
+
+    def _groupCounter(self,groupname,kind):
+        group = self._groups[groupname]
+        prefix = groupname + "."
+        def count(handle, *args):
+            entry = self._handles.get(prefix + handle)
+            if entry is None:
+                entry = self._handles[str(prefix + handle)] = [kind, 0, 0, 0.0]
+            entry[1] += 1
+            entry[2] += 1
+            group[0] += 1
+            group[1] += 1
+        return count
+
+    def Sample(self):
+        '''
+        Send one non-blocking probe call to the root object and each IO Group to measure latency
+        '''
+        probes = [('', self._piio, 'IoGroups', 'nl.miqra.PiIo')]
+        for (name, g) in self._groupobjects:
+            probes.append((name, g, 'Name', 'nl.miqra.PiIo.IoGroup'))
+        for (name, obj, method, interface) in probes:
+            try:
+                obj._asynccall(method, interface=interface,
+                               reply_handler=self._probeReply(self._latency[name], time.time()),
+                               error_handler=lambda e: None)
+            except NoConnectionError as x:
+                pass
+
+    def _probeReply(self,stats,t):
+        return lambda *args: stats.Record(time.time() - t)
+
+    def Roll(self):
+        '''
+        Close the current interval: turn its counts into rates
+        '''
+        now = time.time()
+        elapsed = max(now - self._last, 1e-6)
+        self._last = now
+        for entry in self._handles.values():
+            entry[3] = entry[2] / elapsed
+            entry[2] = 0
+        for entry in self._groups.values():
+            entry[2] = entry[1] / elapsed
+            entry[1] = 0
+
+    def Snapshot(self,top=None):
+        '''
+        Get the current figures as a dict; 'top' limits the number of handles to the busiest ones
+        '''
+        handles = sorted(self._handles.items(), key=lambda item: (-item[1][3], -item[1][1]))
+        if top is not None:
+            handles = handles[:top]
+        return {'time': time.time(),
+                'rate': sum(entry[2] for entry in self._groups.values()),
+                'root': dict(self._root),
+                'latency': self._latency[''].Dict(),
+                'groups': dict((name, {'total': entry[0], 'rate': entry[2], 'latency': self._latency[name].Dict()})
+                               for (name, entry) in self._groups.items()),
+                'handles': [{'handle': handle, 'kind': entry[0], 'total': entry[1], 'rate': entry[3]}
+                            for (handle, entry) in handles]}
+
+def _ms(seconds):
+    if seconds is None:
+        return '-'
+    return "{0:.2f}".format(seconds * 1000)
+
+def _render(snapshot):
+    lines = []
+    lines.append("piio-top - {0}   events/s: {1:.1f}   latency ms: mean {2} max {3}".format(
+                    time.strftime("%H:%M:%S", time.localtime(snapshot['time'])), snapshot['rate'],
+                    _ms(snapshot['latency']['mean']), _ms(snapshot['latency']['max'])))
+    lines.append("root: " + "  ".join("{0} {1}".format(name, total) for (name, total) in sorted(snapshot['root'].items())))
+    lines.append("")
+    lines.append("{0:<24} {1:>10} {2:>10} {3:>10} {4:>10}".format("GROUP", "EVENTS/S", "TOTAL", "LAT MS", "MAX MS"))
+    for (name, group) in sorted(snapshot['groups'].items()):
+        lines.append("{0:<24} {1:>10.1f} {2:>10} {3:>10} {4:>10}".format(
+                        name, group['rate'], group['total'], _ms(group['latency']['mean']), _ms(group['latency']['max'])))
+    lines.append("")
+    lines.append("{0:<32} {1:<16} {2:>10} {3:>10}".format("HANDLE", "KIND", "EVENTS/S", "TOTAL"))
+    for handle in snapshot['handles']:
+        lines.append("{0:<32} {1:<16} {2:>10.1f} {3:>10}".format(handle['handle'], handle['kind'], handle['rate'], handle['total']))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options]", description="Live view of piio signal rates, per group totals and call latency")
+    parser.add_option("-i", "--interval", type="float", default=1.0, help="seconds between refreshes (default %default)")
+    parser.add_option("-n", "--top", type="int", default=20, help="number of handles to show (default %default)")
+    parser.add_option("-a", "--address", default=None, help="D-Bus address of the bus the piio server is on (default: system bus)")
+    parser.add_option("-j", "--json", action="store_true", default=False, help="print a JSON snapshot per interval instead of the live view")
+    parser.add_option("-c", "--count", type="int", default=None, help="exit after this many refreshes")
+    (options, args) = parser.parse_args(argv)
+
+    top = PiIoTop(PiIo(address=options.address, silent=True))
+    loop = gobject.MainLoop()
+    state = {'refreshes': 0}
+
+    def refresh():
+        top.Roll()
+        snapshot = top.Snapshot(options.top)
+        if options.json:
+            sys.stdout.write(json.dumps(snapshot) + "\n")
+        else:
+            # home the cursor and clear the screen, then draw
+            sys.stdout.write("\033[H\033[J" + _render(snapshot) + "\n")
+        sys.stdout.flush()
+        top.Sample()
+        state['refreshes'] += 1
+        if options.count is not None and state['refreshes'] >= options.count:
+            loop.quit()
+            return False
+        return True
+
+    top.Sample()
+    gobject.timeout_add(int(options.interval * 1000), refresh)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
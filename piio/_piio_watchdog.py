@@ -0,0 +1,184 @@
+import sys
+import time
+import thread
+import threading
+import traceback
+import collections
+import gobject
+
+from _event import Event
+from _latency import LatencyStats
+
+def _describe(listener):
+    '''
+    Get a readable name for a listener callable
+    '''
+    name = getattr(listener, '__name__', None)
+    if name is None:
+        return repr(listener)
+    owner = getattr(listener, 'im_self', None)
+    if owner is not None:
+        return "{0}.{1}".format(owner.__class__.__name__, name)
+    module = getattr(listener, '__module__', None)
+    if module is not None:
+        return "{0}.{1}".format(module, name)
+    return name
+
+class PiIoWatchdog(object):
+    '''
+    Opt-in watchdog that finds out what stalls the gobject main loop.
+
+    While started, it measures the dispatch latency of the main loop with a periodic timer, and times
+    every Event listener invocation. Listener invocations and main loop stalls that take longer than
+    the threshold are recorded, together with the event and its arguments (normally the handle and value).
+    When stack sampling is enabled, a sampler thread captures the stack of the main loop thread while it
+    is blocked, which shows where a blocking listener or call is stuck.
+
+    Attributes:
+        Latency:        LatencyStats of the main loop dispatch latency
+        Listeners:      dict of listener name => LatencyStats of its invocations
+        SlowListeners:  list of the most recent slow listener invocations, as dicts
+        Stalls:         list of the most recent main loop stalls, as dicts
+
+    Only one watchdog can be started at a time. Start it from the thread that runs the main loop
+    (with a PiIoThread, use Submit to do so).
+    '''
+    def __init__(self,threshold=0.1,interval=0.1,samplestacks=False,maxrecords=100):
+        '''
+        'threshold' is the number of seconds after which a listener invocation or main loop stall is recorded,
+        'interval' the number of seconds between main loop latency measurements, and 'maxrecords' the number
+        of slow listener and stall records to keep. When 'samplestacks' is True, stacks are captured.
+        '''
+        self.Latency = LatencyStats()
+        self.Listeners = {}
+        self._slow = collections.deque(maxlen=maxrecords)
+        self._stalls = collections.deque(maxlen=maxrecords)
+
+        self._threshold = threshold
+        self._interval = interval
+        self._samplestacks = samplestacks
+
+        self._timer = None
+        self._sampler = None
+        self._running = False
+        self._loopthread = None
+        self._expected = None
+        self._heartbeat = None
+        self._stallstack = None
+        # listener invocations in progress on the main loop thread: [event, listener, args, start, stack]
+        self._active = []
+
+    @property
+    def SlowListeners(self):
+        return list(self._slow)
+
+    @property
+    def Stalls(self):
+        return list(self._stalls)
+
+    def start(self):
+        '''
+        Start watching
+        '''
+        if Event._profiler is not None:
+            raise RuntimeError("Another watchdog is already started")
+        self._running = True
+        self._loopthread = thread.get_ident()
+        self._expected = time.time() + self._interval
+        self._heartbeat = time.time()
+        self._timer = gobject.timeout_add(int(self._interval * 1000), self._onTick)
+        Event._profiler = self
+
+        if self._samplestacks:
+            # the sampler thread needs the main loop to release the interpreter lock while it waits
+            gobject.threads_init()
+            self._sampler = threading.Thread(target=self._sample, name="piio-watchdog")
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def stop(self):
+        '''
+        Stop watching; the collected results remain available
+        '''
+        self._running = False
+        if Event._profiler is self:
+            Event._profiler = None
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def Reset(self):
+        '''
+        Forget all collected results
+        '''
+        self.Latency.Reset()
+        self.Listeners = {}
+        self._slow.clear()
+        self._stalls.clear()
+
+    def Report(self):
+        '''
+        Get all collected results as a dict
+        '''
+        return {'latency': self.Latency.Dict(),
+                'listeners': dict((name, stats.Dict()) for (name, stats) in self.Listeners.items()),
+                'slowlisteners': self.SlowListeners,
+                'stalls': self.Stalls}
+
+    def _onTick(self):
+        now = time.time()
+        late = max(0.0, now - self._expected)
+        self.Latency.Record(late)
+        if late > self._threshold:
+            self._stalls.append({'time': self._expected, 'duration': late, 'stack': self._stallstack})
+        self._stallstack = None
+        self._heartbeat = now
+        self._expected = now + self._interval
+        return self._running
+
+    def _enter(self,event,listener,args):
+        if thread.get_ident() == self._loopthread:
+            self._active.append([event, listener, args, time.time(), None])
+
+    def _leave(self,duration):
+        if thread.get_ident() != self._loopthread:
+            return
+        (event, listener, args, start, stack) = self._active.pop()
+
+        name = _describe(listener)
+        stats = self.Listeners.get(name)
+        if stats is None:
+            stats = self.Listeners[name] = LatencyStats()
+        stats.Record(duration)
+
+        if duration > self._threshold:
+            self._slow.append({'time': start,
+                               'duration': duration,
+                               'event': event.name,
+                               'listener': name,
+                               'args': [str(a) for a in args],
+                               'stack': stack})
+
+    def _sample(self):
+        # runs on the sampler thread; look at the main loop thread while it is blocked
+        while self._running:
+            time.sleep(self._threshold / 2)
+            now = time.time()
+            frame = None
+            try:
+                active = self._active[-1]
+            except IndexError:
+                # main loop thread may finish a listener at any moment
+                active = None
+            if active is not None and active[4] is None and now - active[3] > self._threshold:
+                frame = sys._current_frames().get(self._loopthread)
+                if frame is not None:
+                    active[4] = traceback.format_stack(frame)
+            elif active is None and self._stallstack is None and now - self._heartbeat > self._interval + self._threshold:
+                frame = sys._current_frames().get(self._loopthread)
+                if frame is not None:
+                    self._stallstack = traceback.format_stack(frame)
+            del frame
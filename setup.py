@@ -38,5 +38,6 @@ if __name__ == '__main__':
             'Programming Language :: Python :: 2',
             ],
         packages=['piio'],
+        scripts=['scripts/piio-top'],
         data_files = [ ],
     )